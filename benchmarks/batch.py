@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# batch.py
+#
+# Measures mnt's own overhead for batch mounts and fan-out ssh-exec, with
+# ssh and sshfs replaced by a FakeExecutor, so no hosts are needed and the
+# numbers do not depend on the network.
+#
+# Usage: python3 benchmarks/batch.py [--servers N] [--jobs N] [--latency S] [--lines N]
+
+import os
+import sys
+import json
+import math
+import time
+import tempfile
+import argparse
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_config(home, servers):
+    folder = os.path.join(home, '.config', 'mnt')
+    os.makedirs(folder)
+    config = {'servers': {}, 'aliases': {}, 'groups': {'bench': []}}
+    for i in range(servers):
+        name = f"web-{i}"
+        config['servers'][name] = {
+            'name': name,
+            'command': f"sshfs user@{name}.example.com:/var/www {home}/mnt/{name}",
+            'unmount_command': 'fusermount -u',
+            'mount_path': f"{home}/mnt/{name}",
+            'host': f"user@{name}.example.com",
+            'remote_dir': '/var/www',
+        }
+        config['groups']['bench'].append(name)
+    with open(os.path.join(folder, 'config.json'), 'w') as f:
+        json.dump(config, f)
+
+
+def timed(manager, *argv):
+    start = time.perf_counter()
+    result = manager.run(*argv)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time mnt batch operations against a fake executor.')
+    parser.add_argument('--servers', type=int, default=200)
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--lines', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        make_config(home, args.servers)
+        # mnt finds its config through HOME when it is imported
+        os.environ['HOME'] = home
+        sys.path.insert(0, repo)
+        import mnt
+
+        fake = mnt.FakeExecutor({
+            'sshfs *': mnt.Script(latency=args.latency),
+            'ssh *hang*': mnt.Script(hang=True),
+            'ssh *': mnt.Script(latency=args.latency, lines=args.lines),
+        })
+        manager = mnt.Manager(fake)
+        jobs = ['--jobs', str(args.jobs)]
+        ideal = math.ceil(args.servers / args.jobs) * args.latency
+
+        print(f"{args.servers} servers, {args.jobs} jobs, {args.latency * 1000:.0f} ms per command")
+        rows = [
+            ('mount', ['mount', 'bench'] + jobs, ideal),
+            (f"ssh-exec, {args.lines} lines each", ['ssh-exec', '--group', 'bench'] + jobs + ['--', 'uptime'], ideal),
+            ('ssh-exec, all hang, 0.2 s timeout', ['ssh-exec', '--group', 'bench'] + jobs + ['--timeout', '0.2', '--', 'hang'], math.ceil(args.servers / args.jobs) * 0.2),
+        ]
+        for label, argv, floor in rows:
+            fake.max_running = 0
+            result, seconds = timed(manager, *argv)
+            overhead = (seconds - floor) / args.servers * 1000
+            print(f"  {label.ljust(34)} {seconds:6.2f} s   ideal {floor:6.2f} s   "
+                  f"overhead {overhead:5.2f} ms/server   peak {fake.max_running} running   exit {result.code}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# startup.py
+#
+# Times "mnt cd <name>" against a generated config with many entries.
+# Target: under 30 ms per call with 5,000 entries, run the way bin/mnt runs it.
+#
+# Usage: python3 benchmarks/startup.py [--entries N] [--runs N] [--target-ms N]
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import subprocess
+import statistics
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+script = os.path.join(repo, 'mnt.py')
+
+
+def make_config(home, entries):
+    folder = os.path.join(home, '.config', 'mnt')
+    os.makedirs(folder)
+    config = {'servers': {}, 'aliases': {}, 'groups': {}}
+    for i in range(entries):
+        name = f"web-{i}"
+        config['servers'][name] = {
+            'name': name,
+            'command': 'sshfs',
+            'unmount_command': 'fusermount -u',
+            'mount_path': f"/mnt/{name}",
+            'append_mount_path': True,
+            'host': f"user@{name}.example.com",
+            'remote_dir': '/var/www',
+            'shell': 'bash',
+        }
+    with open(os.path.join(folder, 'config.json'), 'w') as f:
+        json.dump(config, f)
+
+
+def time_runs(cmd, env, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.9) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time mnt startup for hot commands.')
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--target-ms', type=float, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        make_config(home, args.entries)
+        env = dict(os.environ, HOME=home)
+        name = f"web-{args.entries // 2}"
+
+        # Install the module the way bin/mnt expects, with compiled bytecode
+        lib = os.path.join(home, 'lib')
+        os.makedirs(lib)
+        subprocess.run(['cp', script, lib], check=True)
+        subprocess.run([sys.executable, '-m', 'compileall', '-q', lib], check=True)
+        module_cmd = [sys.executable, '-I', '-c', f"import sys; sys.path.insert(0, {lib!r}); import mnt; mnt.main()"]
+
+        # The first run compiles config.cache
+        subprocess.run(module_cmd + ['list'], env=env, stdout=subprocess.DEVNULL, check=True)
+
+        results = [
+            ('python3 -c pass', [sys.executable, '-c', 'pass']),
+            (f"mnt cd {name} (script)", [sys.executable, script, 'cd', name]),
+            (f"mnt cd {name}", module_cmd + ['cd', name]),
+        ]
+        print(f"{args.entries} entries, {args.runs} runs each")
+        for label, cmd in results:
+            median, p90 = time_runs(cmd, env, args.runs)
+            print(f"  {label.ljust(32)} median {median:6.1f} ms   p90 {p90:6.1f} ms")
+
+    print(f"Target: mnt cd {name} under {args.target_ms:.0f} ms")
+    if median > args.target_ms:
+        print('Target missed.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,55 +2,469 @@
 # mnt.py
 
 import os
-import json
 import sys
 import time
-import shlex
-import subprocess
+import marshal
+import threading
+
+
+class LazyModule:
+    """
+    Imports a module the first time one of its attributes is used. Hot
+    commands like cd never need most of these, and importing them all would
+    cost more than the rest of the run.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = __import__(self.name, fromlist=['_'])
+        return getattr(self.module, attr)
+
+json = LazyModule('json')
+fcntl = LazyModule('fcntl')
+shlex = LazyModule('shlex')
+signal = LazyModule('signal')
+tempfile = LazyModule('tempfile')
+socket = LazyModule('socket')
+struct = LazyModule('struct')
+selectors = LazyModule('selectors')
+subprocess = LazyModule('subprocess')
+futures = LazyModule('concurrent.futures')
+random = LazyModule('random')
+shutil = LazyModule('shutil')
+re = LazyModule('re')
+fnmatch = LazyModule('fnmatch')
+io = LazyModule('io')
 
 
 config_folder = os.path.expanduser('~/.config/mnt')
 config_path = os.path.join(config_folder, 'config.json')
+masters_folder = os.path.join(config_folder, 'masters')
+sessions_folder = os.path.join(config_folder, 'sessions')
+history_path = os.path.join(config_folder, 'history.json')
+history_length = 50
+state_path = os.path.join(config_folder, 'state.jsonl')
+tunnels_lock_path = os.path.join(config_folder, 'tunnels')
+watch_log_path = os.path.join(config_folder, 'watch.log')
+cache_path = os.path.join(config_folder, 'config.cache')
+cache_version = 5
+state_compact_lines = 1000
+default_control_persist = '10m'
+default_tunnel_timeout = 10.0
+
+# The loaded config.json, set by reload_config
+config = None
+
+class MntError(Exception):
+    """Base of the errors raised to callers of the library API."""
+
+class ConfigError(MntError):
+    """config.json could not be read."""
+
+class ServerNotFound(MntError):
+    """No server or alias has the given name."""
+
+class InvalidValue(MntError):
+    """A property name or value was rejected."""
+
+class Result:
+    """What one operation did: its exit code, captured output and timings."""
+
+    __slots__ = ["name", "code", "output", "started", "duration"]
+
+    def __init__(self, name, code, output, started, duration):
+        self.name = name
+        self.code = code
+        self.output = output
+        # Wall-clock start, and seconds taken
+        self.started = started
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.code == 0
+
+    def __repr__(self):
+        return f"Result({self.name!r}, code={self.code}, duration={self.duration:.3f})"
+
+class CommandFailed(MntError):
+    """An operation run with check = True exited non-zero. Its Result is in result."""
+
+    def __init__(self, result):
+        super().__init__(f"{result.name} exited with code {result.code}")
+        self.result = result
+
+class CommandTimeout(CommandFailed):
+    """An operation run with check = True was killed after its timeout."""
 
 def setup_config():
     if not os.path.exists(config_folder):
         os.makedirs(config_folder)
 
+    for folder in (masters_folder, sessions_folder):
+        if not os.path.exists(folder):
+            os.makedirs(folder, mode=0o700)
+
 
     if not os.path.exists(config_path):
-        with open(config_path, 'w') as f:
-            json.dump({'servers': {}, 'aliases': {}}, f)
+        write_json_atomic(config_path, {'servers': {}, 'aliases': {}, 'groups': {}})
 
     try:
+        signature = config_signature()
         with open(config_path) as f:
             config = json.load(f)
     except json.decoder.JSONDecodeError:
-        print('Invalid JSON in config-file.')
-        sys.exit(0)
-    return config
+        raise ConfigError('Invalid JSON in config-file.')
+    config.setdefault('groups', {})
+    config.setdefault('profiles', {})
+    return config, signature
+
+# Batch operations either collect each server's output here, to print it as
+# one block once that server is done, or set a prefix to stream it live.
+# The library API sets plain as well, to capture output without colors, and
+# the daemon and Manager.run set stdout and stderr to send a command's output
+# elsewhere without touching sys.stdout. live is set while a command line
+# runs, so Manager operations write their output as it happens.
+output_context = threading.local()
+print_lock = threading.Lock()
+
+# The command line run on this thread, when it isn't this process's own:
+# argv, the cwd relative paths are taken from, the executor, and the daemon's
+# ssh-exec delegate
+command_context = threading.local()
+
+# Guards the shared config dict and config file against concurrent workers
+config_lock = threading.RLock()
+
+def write_output(text, end='\n'):
+    lines = getattr(output_context, 'lines', None)
+    prefix = getattr(output_context, 'prefix', None)
+    if lines is not None:
+        lines.append(text + end)
+    elif prefix is not None:
+        with print_lock:
+            output_stream().write(f"[{prefix}] {text}{end}")
+            output_stream().flush()
+    else:
+        output_stream().write(text + end)
+        output_stream().flush()
+
+def output_stream():
+    return getattr(output_context, 'stdout', None) or sys.stdout
+
+def error_stream():
+    return getattr(output_context, 'stderr', None) or sys.stderr
+
+def write_error(data):
+    """Writes text or bytes to the command's stderr."""
+    write_stream(error_stream(), data)
+
+def write_stream(stream, data):
+    if isinstance(data, bytes):
+        if hasattr(stream, 'buffer'):
+            stream.buffer.write(data)
+            stream.buffer.flush()
+            return
+        data = data.decode(errors='replace')
+    stream.write(data)
+    stream.flush()
+
+def output_redirected():
+    """Whether this thread's output is collected rather than going to the terminal."""
+    return getattr(output_context, 'lines', None) is not None or getattr(output_context, 'stdout', None) is not None
+
+def command_args():
+    return getattr(command_context, 'argv', None) or sys.argv
+
+def local_path(path):
+    """path, relative to the command's working directory if it is not this process's."""
+    path = os.path.expanduser(path)
+    cwd = getattr(command_context, 'cwd', None)
+    return path if cwd is None else os.path.join(cwd, path)
+
+def in_context(fn):
+    """
+    Wraps fn to run with the calling thread's output and command context,
+    for work handed to other threads.
+    """
+    output, command = dict(vars(output_context)), dict(vars(command_context))
 
-def run_command(cmd, indent = False):
-    result = subprocess.run(
-        cmd, 
-        shell=True, 
-        check=False,
-        capture_output=True, 
-        text=True
-    )
+    def run(*args, **kwargs):
+        vars(output_context).update(output)
+        vars(command_context).update(command)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            vars(output_context).clear()
+            vars(command_context).clear()
+    return run
 
-    if result.stdout:
-        for line in result.stdout.splitlines():
-            if indent:
-                print(f"    {line}")
-            else:
-                print(line)
+def get_executor():
+    return getattr(command_context, 'executor', None) or executor
 
-    if result.stderr:
-        for line in result.stderr.splitlines():
-            if indent:
-                print(f"    {line}")
-            else:
-                print(line)
+class SubprocessExecutor:
+    """
+    Runs commands as processes. Every command mnt runs goes through the
+    executor in the module's executor variable, so it can be swapped for a
+    FakeExecutor. Commands given as a string run in a shell.
+    """
+
+    def stream(self, cmd, emit, timeout = None):
+        """
+        Runs cmd and calls emit(line) with each line of its output as it
+        arrives, with stdout and stderr interleaved in the order they were
+        written.
+
+        Returns the exit code, or None if the command was killed after timeout seconds.
+        """
+        process = subprocess.Popen(
+            cmd,
+            shell=isinstance(cmd, str),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            # Own process group, so a timeout also kills whatever the shell started
+            start_new_session=timeout is not None
+        )
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        returncode = None
+        pending = b''
+        exited_at = None
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ)
+            while True:
+                now = time.monotonic()
+                if exited_at is None and process.poll() is not None:
+                    exited_at = now
+                if exited_at is not None:
+                    # Something the command left running in the background may
+                    # still hold the pipe open, so only wait briefly for the rest
+                    if now >= exited_at + 1:
+                        break
+                    wait = exited_at + 1 - now
+                elif deadline is not None and now >= deadline:
+                    os.killpg(process.pid, signal.SIGKILL)
+                    process.wait()
+                    returncode = 124
+                    break
+                else:
+                    wait = 0.5 if deadline is None else min(deadline - now, 0.5)
+                if selector.select(wait):
+                    chunk = os.read(process.stdout.fileno(), 65536)
+                    if not chunk:
+                        break
+                    pending += chunk
+                    *lines, pending = pending.split(b'\n')
+                    for line in lines:
+                        emit(line)
+        process.stdout.close()
+
+        if pending:
+            emit(pending)
+        if returncode == 124:
+            return None
+        return process.wait()
+
+    def run(self, cmd, timeout = None):
+        """
+        Runs cmd with its output captured as text and returns a
+        subprocess.CompletedProcess. Raises subprocess.TimeoutExpired after
+        timeout seconds, and FileNotFoundError if the program does not exist.
+        """
+        return subprocess.run(cmd, shell=isinstance(cmd, str), capture_output=True, text=True, stdin=subprocess.DEVNULL, timeout=timeout)
+
+    def interactive(self, cmd, stderr_filter = None):
+        """
+        Runs cmd on this terminal and returns its exit code. With stderr_filter,
+        cmd's stderr is passed to stderr_filter(stream) instead.
+        """
+        process = subprocess.Popen(cmd, shell=isinstance(cmd, str), stderr=subprocess.PIPE if stderr_filter else None)
+        if stderr_filter is not None:
+            stderr_filter(process.stderr)
+        return process.wait()
+
+    def spawn(self, cmd, **options):
+        """Starts cmd with subprocess.Popen options and returns the process, for pipes and background work."""
+        return subprocess.Popen(cmd, **options)
+
+class Script:
+    """
+    How a FakeExecutor answers a command: after latency seconds it has
+    printed output, then lines more lines of line_bytes each, written stderr
+    and exited with code. A command that hangs only ends when it is killed,
+    and one that is missing fails as if the program does not exist.
+    """
+
+    __slots__ = ["code", "latency", "output", "lines", "line_bytes", "stderr", "hang", "missing"]
+
+    def __init__(self, code = 0, latency = 0.0, output = b'', lines = 0, line_bytes = 80, stderr = b'', hang = False, missing = False):
+        self.code = code
+        self.latency = latency
+        self.output = output
+        self.lines = lines
+        self.line_bytes = line_bytes
+        self.stderr = stderr
+        self.hang = hang
+        self.missing = missing
+
+    def stdout(self):
+        return self.output + (b'x' * (self.line_bytes - 1) + b'\n') * self.lines
+
+class FakeProcess:
+    """A Popen stand-in for a scripted command. Its pipes are in-memory files."""
+
+    def __init__(self, executor, args, script):
+        self.executor = executor
+        self.args = args
+        self.script = script
+        self.pid = None
+        self.returncode = None
+        self.started = time.monotonic()
+        self.killed = threading.Event()
+        self.stdin = io.BytesIO()
+        self.stdout = io.BytesIO(script.stdout())
+        self.stderr = io.BytesIO(script.stderr)
+
+    def remaining(self):
+        """Seconds until the command exits by itself, or None if it hangs."""
+        if self.script.hang:
+            return None
+        return max(self.started + self.script.latency - time.monotonic(), 0)
+
+    def finish(self):
+        if self.returncode is None:
+            self.returncode = -9 if self.killed.is_set() else self.script.code
+            self.executor.finished()
+        return self.returncode
+
+    def poll(self):
+        if self.returncode is None and (self.killed.is_set() or self.remaining() == 0):
+            self.finish()
+        return self.returncode
+
+    def wait(self, timeout = None):
+        if self.returncode is not None:
+            return self.returncode
+        remaining = self.remaining()
+        if timeout is not None and (remaining is None or remaining > timeout):
+            if not self.killed.wait(timeout):
+                raise subprocess.TimeoutExpired(self.args, timeout)
+        else:
+            self.killed.wait(remaining)
+        return self.finish()
+
+    def kill(self):
+        self.killed.set()
+        # Callers such as probe_mount don't wait for what they killed
+        self.finish()
+
+    terminate = kill
+
+class FakeExecutor:
+    """
+    Runs nothing. Each command, joined into one string, is answered by the
+    Script of the first pattern (fnmatch) it matches, or by default, so
+    mnt's own overhead, concurrency and timeouts can be tested offline:
+
+        fake = FakeExecutor({'sshfs *': Script(latency = 0.2), 'ssh -O *': Script(code = 255)})
+
+    calls lists the commands run, and max_running the most that ran at once.
+    """
+
+    def __init__(self, scripts = None, default = None):
+        self.scripts = list((scripts or {}).items())
+        self.default = default or Script()
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def start(self, cmd):
+        args = cmd if isinstance(cmd, str) else shlex.join(str(part) for part in cmd)
+        script = next((script for pattern, script in self.scripts if fnmatch.fnmatchcase(args, pattern)), self.default)
+        with self.lock:
+            self.calls.append(args)
+            if script.missing:
+                raise FileNotFoundError(f"No such file or directory: {args.split()[0]}")
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        return FakeProcess(self, args, script)
+
+    def finished(self):
+        with self.lock:
+            self.running -= 1
+
+    def stream(self, cmd, emit, timeout = None):
+        process = self.start(cmd)
+        try:
+            code = process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            return None
+        for stream in (process.stdout, process.stderr):
+            for line in stream.read().splitlines():
+                emit(line)
+        return code
+
+    def run(self, cmd, timeout = None):
+        process = self.start(cmd)
+        try:
+            code = process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            raise
+        return subprocess.CompletedProcess(process.args, code, process.stdout.read().decode(errors='replace'), process.stderr.read().decode(errors='replace'))
+
+    def interactive(self, cmd, stderr_filter = None):
+        process = self.start(cmd)
+        code = process.wait()
+        write_output(process.stdout.read().decode(errors='replace'), end='')
+        if stderr_filter is not None:
+            stderr_filter(process.stderr)
+        else:
+            write_error(process.stderr.read())
+        return code
+
+    def spawn(self, cmd, **options):
+        return self.start(cmd)
+
+executor = SubprocessExecutor()
+
+def use_executor(new):
+    """Makes every command mnt runs from now on go through new."""
+    global executor
+    executor = new
+
+def run_command(cmd, indent = False, timeout = None):
+    """
+    Runs cmd and prints its output line by line as it arrives, with stdout and
+    stderr interleaved in the order they were written.
+
+    Returns the exit code, or 124 if the command was killed after timeout seconds.
+    """
+    def emit(line):
+        line = line.decode(errors='replace').rstrip('\r\n')
+        if indent:
+            write_output(f"    {line}")
+        else:
+            write_output(line)
+
+    returncode = get_executor().stream(cmd, emit, timeout)
+    if returncode is None:
+        write_output(f"Timed out after {timeout:.1f} seconds.")
+        return 124
+    return returncode
+
+def time_left(deadline):
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
 
 def print_styled(text, style=None, newline=True):
     """
@@ -102,42 +516,44 @@ def print_styled(text, style=None, newline=True):
             if s in styles:
                 style_codes.append(styles[s])
 
-    # Apply styles
-    styled_text = ''.join(style_codes) + text + reset
+    # Apply styles, unless the output is captured for the library API
+    if getattr(output_context, 'plain', False):
+        styled_text = text
+    else:
+        styled_text = ''.join(style_codes) + text + reset
 
     # Print with or without newline
     end = '\n' if newline else ''
-    print(styled_text, end=end)
+    write_output(styled_text, end=end)
 
 class Server:
 
-    prop_list = ["name", "command","unmount_command","mounted_time","mount_path","append_mount_path","host","key_path","remote_dir","pre_command","shell","port","tunnel_port","tunnel_host","tunnel_username","tunnel_key_path","tunnel_forwarded_host"]
+    prop_list = ["name", "command","unmount_command","mounted_time","mount_path","append_mount_path","host","key_path","remote_dir","pre_command","shell","port","tunnel_port","tunnel_host","tunnel_username","tunnel_key_path","tunnel_forwarded_host","control_persist","tunnel_timeout","profile","mode","include","exclude","warm_paths"]
 
-    def __init__(self, name, parent_name, command, unmount_command, append_mount_path, mounted_time, mount_path, is_alias = False, aliased_properties = [], host=None, key_path=None, remote_dir=None, pre_command=None, shell=None, port="22", tunnel_port=None, tunnel_host=None, tunnel_key_path=None, tunnel_username=None, tunnel_forwarded_host=None):
-        self.is_alias = is_alias
+    __slots__ = ["parent_name", "is_alias", "aliased_properties", "changed"] + prop_list
+
+    def __init__(self, name, parent_name = None, is_alias = False, aliased_properties = None, **props):
         self.name = name
-        self.parent_name = parent_name 
-        self.command = command
-        self.unmount_command = unmount_command
-        self.append_mount_path = append_mount_path
-        self.mounted_time = mounted_time
-        self.mount_path = mount_path
-        self.host = host
-        self.key_path = key_path
-        self.remote_dir = remote_dir
-        self.pre_command = pre_command
-        self.shell = shell
-        self.port = port
-        self.tunnel_port = tunnel_port 
-        self.tunnel_host = tunnel_host
-        self.tunnel_key_path = tunnel_key_path
-        self.tunnel_username = tunnel_username
-        self.tunnel_forwarded_host = tunnel_forwarded_host
-        self.aliased_properties = aliased_properties
-
-    def store_if_not_aliased(self, prop):
-        if prop not in self.aliased_properties and self.is_alias is False:
-            config['servers'][self.name][prop] = getattr(self, prop, None) 
+        self.parent_name = parent_name
+        self.is_alias = is_alias
+        self.aliased_properties = list(aliased_properties or [])
+        for prop in self.prop_list[1:]:
+            setattr(self, prop, props.get(prop))
+        # Properties set since the last save, the only ones save_server writes
+        self.changed = set()
+
+    @classmethod
+    def from_config(cls, name, server, alias = None):
+        """Resolves a server entry, with an alias's own properties laid over its parent's."""
+        if alias is None:
+            props = server
+            aliased_properties = []
+        else:
+            props = dict(server, **alias)
+            aliased_properties = [prop for prop in cls.prop_list if prop in alias]
+        props = {prop: props.get(prop) for prop in cls.prop_list[1:]}
+        props['mounted_time'] = get_state(name, 'mounted_time', props['mounted_time'])
+        return cls(name, alias['server_name'] if alias else None, alias is not None, aliased_properties, **props)
 
     def get(self, prop):
         return getattr(self, prop, None)
@@ -148,38 +564,58 @@ class Server:
         else:
             return self.get("host")
 
+    def control_options(self):
+        """ssh options that share one persistent master connection per host."""
+        persist = self.get('control_persist') or default_control_persist
+        if persist == 'off':
+            return []
+        return [
+            '-o', 'ControlMaster=auto',
+            '-o', f"ControlPath={os.path.join(masters_folder, '%C')}",
+            '-o', f"ControlPersist={persist}"
+        ]
+
+    def mount_options(self):
+        """
+        sshfs -o options: the server's profile, then its key and connection
+        sharing options. A later option replaces an earlier one of the same name.
+        """
+        options = {}
+        sources = [profile_options(self.get('profile'))]
+        if self.key_path:
+            sources.append([f"IdentityFile={os.path.expanduser(self.get('key_path'))}"])
+        sources.append([option for option in self.control_options() if option != '-o'])
+        for source in sources:
+            for option in source:
+                options[option.split('=', 1)[0]] = option
+        return list(options.values())
+
+    def ssh_target(self):
+        """Port and host arguments for ssh, so ssh -O addresses the right master."""
+        if self.get('port') is not None:
+            return ['-p', str(self.get('port')), self.get_host()]
+        return [self.get_host()]
+
 
     def set(self, prop, value, save = True):
         setattr(self, prop, value)
-        if save:
-            if self.is_alias:
-                self.set_aliased(prop, value, False)
-            self.save_server()
-
-    def set_aliased(self, prop, value, save = True):
-        self.is_alias = True
-        if prop not in self.aliased_properties:
+        self.changed.add(prop)
+        if self.is_alias and prop not in self.aliased_properties:
             self.aliased_properties.append(prop)
-        setattr(self, prop, value)
         if save:
             self.save_server()
-    
-    def save_server(self):
-        if self.is_alias:
-            if self.name not in config['aliases']:
-                config['aliases'][self.name] = {}
-        else:
-            if self.name not in config['servers']:
-                config['servers'][self.name] = {}
 
-        if self.is_alias:
-            for prop in self.aliased_properties:
-                config['aliases'][self.name][prop] = getattr(self, prop, None)
+    def save_server(self, props = None):
+        """Writes the changed properties, or the given ones, to the config."""
+        section = 'aliases' if self.is_alias else 'servers'
+        with config_lock:
+            values = {prop: getattr(self, prop, None) for prop in (self.changed if props is None else props)}
+            self.changed.clear()
 
-        for prop in self.prop_list:
-            self.store_if_not_aliased(prop)
+            def change(current):
+                current[section].setdefault(self.name, {}).update(values)
 
-        save_config()
+            save_config(change)
 
     def assemble_mount_command(self):
         if self.get('command') == "sshfs":
@@ -189,64 +625,221 @@ class Server:
                 command = f"{self.get('command')} {self.get_host()}"
             if self.remote_dir:
                 command = command + f":{self.get('remote_dir')}"
-            if self.key_path:
-                key_path = os.path.expanduser(self.get('key_path'))
-                command = command + f" -o IdentityFile={key_path}"
+            for option in self.mount_options():
+                command = command + f" -o {shlex.quote(option)}"
             if self.append_mount_path:
                 command = command + f" {self.get('mount_path')}"
-                if not os.path.exists(self.get('mount_path')):
-                    os.makedirs(self.get('mount_path'), exist_ok=True)
             return command
         else:
             command = f"{self.get('command')}"
             if self.append_mount_path:
                 command = command + f" {self.get('mount_path')}"
-                if not os.path.exists(self.get('mount_path')):
-                    os.makedirs(self.get('mount_path'), exist_ok=True)
             return command
 
-    def assemble_unmount_command(self):
+    def assemble_unmount_command(self, lazy = False):
         command = f"{self.get('unmount_command')}"
+        if lazy:
+            # Detach without waiting on a dead endpoint
+            program = os.path.basename(command.split()[0]) if command.split() else ''
+            if program.startswith('fusermount'):
+                command = command + " -z"
+            elif program == 'umount':
+                command = command + " -l"
         if self.append_mount_path:
             command = command + f" {self.get('mount_path')}"
         return command
 
-    def setup_tunnel(self):
-        print_styled("Setting up tunnel...", "blue")
+    def resolve_tunnel(self):
         if self.get('tunnel_username') is None:
             self.tunnel_username = self.get('host').rsplit('@', 1)[0]
         if self.get('tunnel_forwarded_host') is None:
             self.tunnel_forwarded_host = self.get('host').rsplit('@', 1)[1]
-        cmd = f"ssh -f -N -L {self.get('port')}:{self.get('tunnel_forwarded_host')}:{self.get('tunnel_port')} {self.get('tunnel_username')}@{self.get('tunnel_host')}"
+
+    def tunnel_key(self):
+        """Identifies the tunnel, so servers sharing one only open it once."""
+        self.resolve_tunnel()
+        return (self.get('tunnel_username'), self.get('tunnel_host'), str(self.get('tunnel_port')), self.get('tunnel_forwarded_host'), str(self.get('port')))
+
+    def tunnel_id(self):
+        """Name of the tunnel's record in the state store."""
+        user, host, port, forwarded_host, local_port = self.tunnel_key()
+        return f"tunnel:{local_port}:{forwarded_host}:{port}:{user}@{host}"
+
+    def tunnel_control(self):
+        """ssh arguments that address the tunnel's own control socket."""
+        self.resolve_tunnel()
+        socket_path = os.path.join(masters_folder, f"tunnel-{self.get('port')}-%C")
+        return ['-S', socket_path, f"{self.get('tunnel_username')}@{self.get('tunnel_host')}"]
+
+    def claim_tunnel(self):
+        """
+        Adds this server to the users of its tunnel, if mnt opened it.
+        Returns the tunnel's pid, or None if mnt did not open it.
+        """
+        with config_lock, file_lock(tunnels_lock_path):
+            # Another process may have closed it since this one read state
+            refresh_state()
+            tunnel = self.tunnel_id()
+            pid = get_state(tunnel, 'pid')
+            refs = get_state(tunnel, 'refs') or []
+            if pid is not None and self.name not in refs:
+                set_state(tunnel, refs = refs + [self.name])
+            return pid
+
+    def setup_tunnel(self, timeout = None):
+        """
+        Opens the tunnel, or reuses it if its local port already answers, and
+        returns once the port accepts connections.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.resolve_tunnel()
+        tunnel = self.tunnel_id()
+        if port_open(self.get('port')):
+            pid = self.claim_tunnel()
+            if pid is None:
+                print_styled(f"Port {self.get('port')} is already open, not started by mnt. Using it as the tunnel.", "yellow")
+            else:
+                print_styled(f"Reusing tunnel on port {self.get('port')} (pid {pid}).", "blue")
+            return 0
+
+        print_styled("Setting up tunnel...", "blue")
+        # A control socket of its own lets the tunnel be found and closed exactly
+        control = self.tunnel_control()
+        cmd = f"ssh -f -N -M -S {shlex.quote(control[1])} -o ExitOnForwardFailure=yes -L {self.get('port')}:{self.get('tunnel_forwarded_host')}:{self.get('tunnel_port')} {control[2]}"
         if self.get('tunnel_key_path') is not None:
             cmd += f" -i {os.path.expanduser(self.get('tunnel_key_path'))}"
         print_styled(cmd, "italic")
-        run_command(cmd, indent = False)
-
-    def destroy_tunnel(self):
-        cmd = f"kill $(lsof -ti :{self.port})"
+        status = run_command(cmd, indent = False, timeout = timeout)
+        if status != 0:
+            return status
+
+        # ssh -f can return before the forwarded port listens
+        wait = self.get('tunnel_timeout')
+        wait = default_tunnel_timeout if wait is None else float(wait)
+        if deadline is not None:
+            wait = min(wait, time_left(deadline))
+        latency = wait_for_port(self.get('port'), wait)
+        if latency is None:
+            print_styled(f"Tunnel on port {self.get('port')} did not accept connections within {wait:.1f}s.", "red")
+            get_executor().run(['ssh', '-O', 'exit'] + control)
+            return 1
+        print_styled(f"Tunnel ready after {latency:.2f}s.", "blue")
+
+        result = get_executor().run(['ssh', '-O', 'check'] + control)
+        pid = result.stderr.partition('pid=')[2].partition(')')[0]
+        with config_lock, file_lock(tunnels_lock_path):
+            set_state(tunnel, pid = int(pid) if pid.isdigit() else None, socket = control[1], refs = [self.name])
+        return 0
+
+    def destroy_tunnel(self, timeout = None):
+        """Closes the tunnel once no other mounted server uses it."""
+        with config_lock, file_lock(tunnels_lock_path):
+            refresh_state()
+            tunnel = self.tunnel_id()
+            pid = get_state(tunnel, 'pid')
+            if pid is None:
+                print_styled(f"No tunnel opened by mnt on port {self.get('port')}.", "italic")
+                return 0
+            refs = [name for name in get_state(tunnel, 'refs') or [] if name != self.name]
+            if refs:
+                set_state(tunnel, refs = refs)
+                print_styled(f"Tunnel on port {self.get('port')} is still used by {', '.join(refs)}.", "italic")
+                return 0
+            set_state(tunnel, pid = None, refs = [])
+
+        cmd = f"ssh -O exit -S {shlex.quote(self.tunnel_control()[1])} {self.tunnel_control()[2]}"
         print_styled(cmd, "italic")
-        run_command(cmd, indent = False)
-
-    def mount(self, exit = True, indent = False):
-        self.set("mounted_time", int(time.time()))
-        if self.get("tunnel_port") is not None:
-            self.setup_tunnel()
-        print_styled("Mounting...", "blue")
-        cmd = self.assemble_mount_command()
+        status = run_command(cmd, indent = False, timeout = timeout)
+        if status == 0:
+            return 0
+        if not is_tunnel_process(pid, self.get('port')):
+            # Gone already, or its pid now belongs to another process
+            print_styled(f"Tunnel on port {self.get('port')} was already closed.", "italic")
+            return 0
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        return 0
+
+    def check_existing_mount(self, snapshot):
+        """
+        Makes sure mounting won't stat a dead mount at mount_path, by detaching
+        one that doesn't respond.
+
+        Returns mounted if a working mount is already there, free if nothing is
+        mounted there (any more), or busy if a dead mount could not be detached.
+        """
+        if snapshot.mount_of(self) is None:
+            return 'free'
+        health, _ = probe_mount(self.get('mount_path'))
+        if health in ('healthy', 'slow'):
+            print_styled("Already mounted.", "green")
+            return 'mounted'
+        print_styled(f"Existing mount is {health}, detaching it first.", "yellow")
+        cmd = self.assemble_unmount_command(lazy = True)
         print_styled(cmd, "italic")
-        run_command(cmd, indent)
-        if exit:
-            sys.exit(0)
-
-    def unmount(self, exit = True, indent = False):
-        cmd = self.assemble_unmount_command()
+        if run_command(cmd, timeout = health_timeout) != 0:
+            print_styled(f"Could not detach the {health} mount at {self.get('mount_path')}, not mounting over it.", "red")
+            return 'busy'
+        return 'free'
+
+    def mount(self, indent = False, tunnel = True, timeout = None, snapshot = None):
+        """Mounts the server, or syncs it if it is a mirror. Returns the exit code."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.mounted_time = int(time.time())
+        set_state(self.name, mounted_time = self.mounted_time)
+        record_mount(self.name, self.mounted_time)
+        existing = self.check_existing_mount(snapshot or MountSnapshot())
+        if existing != 'free':
+            return 0 if existing == 'mounted' else 1
+        status = 0
+        if tunnel and self.get("tunnel_port") is not None:
+            status = self.setup_tunnel(time_left(deadline))
+        if self.get('mode') == 'mirror':
+            # A local copy instead of a mount, so there is no mounted state
+            if status == 0:
+                print_styled("Syncing mirror...", "blue")
+                status = mirror_sync(self, 'pull', time_left(deadline))
+            return status
+        if status == 0:
+            print_styled("Mounting...", "blue")
+            # Safe to stat now: nothing, or nothing alive, is mounted there
+            if self.append_mount_path:
+                os.makedirs(self.get('mount_path'), exist_ok=True)
+            cmd = self.assemble_mount_command()
+            print_styled(cmd, "italic")
+            status = run_command(cmd, indent, time_left(deadline))
+        if status == 0:
+            set_state(self.name, mounted = True)
+            if self.get('warm_paths'):
+                start_warm(self)
+        return status
+
+    def unmount(self, indent = False, timeout = None, snapshot = None):
+        """Unmounts the server and closes its tunnel, or pushes a mirror back. Returns the exit code."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.get('mode') == 'mirror':
+            # Push local changes back, the local copy stays
+            status = mirror_sync(self, 'push', timeout)
+            if self.get("tunnel_port") is not None:
+                status = self.destroy_tunnel(time_left(deadline)) or status
+            return status
+        lazy = False
+        if (snapshot or MountSnapshot()).mount_of(self) is not None:
+            health, _ = probe_mount(self.get('mount_path'))
+            lazy = health in ('hung', 'broken')
+            if lazy:
+                print_styled(f"Mount is {health}, detaching lazily.", "yellow")
+        cmd = self.assemble_unmount_command(lazy)
+        tunnel_status = 0
         if self.get("tunnel_port") is not None:
-            self.destroy_tunnel()
+            tunnel_status = self.destroy_tunnel(time_left(deadline))
         print_styled(cmd, "italic")
-        run_command(cmd, indent)
-        if exit:
-            sys.exit(0)
+        status = run_command(cmd, indent, time_left(deadline))
+        if status == 0:
+            set_state(self.name, mounted = False)
+        return status or tunnel_status
 
     def is_latest(self):
         if self.name == last_mounted_server():
@@ -254,152 +847,618 @@ class Server:
         else:
             return False
 
-    def list(self):
+    def list(self, aliases = None):
+        if aliases is None:
+            aliases = [alias for alias in config['aliases'].values() if alias['server_name'] == self.name]
         if not self.is_alias:
             print_styled(f"--- {self.name} {'(latest)' if self.is_latest() else ''}  ---", "bold")
-            print(f"Mount command: \"{self.get('command')}\"")
-            print(f"Host: \"{self.get('host')}\"")
-            print(f"Unmount command: \"{self.get('unmount_command')}\"")
-            print(f"Mounted at: {self.get('mounted_time')} {'(latest)' if self.is_latest() else ''}")
-            print(f"Mount path: {self.get('mount_path')}")
-            print(f"Remote directory: {self.get('remote_dir')}")
+            write_output(f"Mount command: \"{self.get('command')}\"")
+            write_output(f"Host: \"{self.get('host')}\"")
+            write_output(f"Unmount command: \"{self.get('unmount_command')}\"")
+            write_output(f"Mounted at: {self.get('mounted_time')} {'(latest)' if self.is_latest() else ''}")
+            write_output(f"Mount path: {self.get('mount_path')}")
+            write_output(f"Remote directory: {self.get('remote_dir')}")
             if self.get('port') is not None:
-                print(f"Port: {self.get('port')}")
+                write_output(f"Port: {self.get('port')}")
             if self.get('shell') is not None:
-                print('- SSH Exec')
-                print(f"  Shell: {self.get('shell')}")
+                write_output('- SSH Exec')
+                write_output(f"  Shell: {self.get('shell')}")
             if self.get('pre_command') is not None:
-                print(f"  Pre command: {self.get('pre_command')}")
+                write_output(f"  Pre command: {self.get('pre_command')}")
             if self.get('key_path') is not None:
-                print(f"  Key path: {self.get('key_path')}")
+                write_output(f"  Key path: {self.get('key_path')}")
+            if self.get('control_persist') is not None:
+                write_output(f"  Control persist: {self.get('control_persist')}")
+            if self.get('profile') is not None:
+                write_output(f"Profile: {self.get('profile')}")
+            if self.get('mode') == 'mirror':
+                write_output("Mode: mirror")
             if self.get('tunnel_port') is not None:
-                print('- SSH Tunnel')
-                print(f"  Tunnel server port: {self.get('tunnel_port')}")
-                print(f"  Tunnel host: {self.get('tunnel_host')}")
+                write_output('- SSH Tunnel')
+                write_output(f"  Tunnel server port: {self.get('tunnel_port')}")
+                write_output(f"  Tunnel host: {self.get('tunnel_host')}")
+                if self.get('tunnel_timeout') is not None:
+                    write_output(f"  Tunnel timeout: {self.get('tunnel_timeout')}")
                 if self.get('tunnel_username') is not None:
-                    print(f"  Tunnel username: {self.get('tunnel_username')}")
+                    write_output(f"  Tunnel username: {self.get('tunnel_username')}")
                 if self.get('tunnel_key_path') is not None:
-                    print(f"  Tunnel key path: {self.get('tunnel_key_path')}")
+                    write_output(f"  Tunnel key path: {self.get('tunnel_key_path')}")
             print_alias = False
-            for alias in config['aliases']:
-                alias = config['aliases'][alias]
+            for alias in aliases:
                 if alias['server_name'] == self.name:
                     if not print_alias:
-                        print('- Aliases')
+                        write_output('- Aliases')
                         print_alias = True
-                    print(f"--- {alias['name']} --- {'(latest)' if alias['name'] == last_mounted_server() else ''}")
+                    write_output(f"--- {alias['name']} --- {'(latest)' if alias['name'] == last_mounted_server() else ''}")
+                    mounted_time = get_state(alias['name'], 'mounted_time', alias.get('mounted_time'))
+                    if mounted_time is not None:
+                        write_output(f"  mounted_time: {mounted_time} {'(latest)' if alias['name'] == last_mounted_server() else ''}")
                     for prop in alias:
-                        if prop != 'server_name' and prop != 'name':
-                            if prop == 'mounted_time':
-                                print(f"  {prop}: {alias[prop]} {'(latest)' if alias['name'] == last_mounted_server() else ''}")
-                            else:
-                                print(f"  {prop}: {alias[prop]}")
-
-            print('')
-
-
-def get_server_or_alias_prop(prop, server, alias, aliased_properties = []):
-    if alias:
-        if prop in alias:
-            if prop not in aliased_properties:
-                aliased_properties.append(prop)
-            return alias[prop]
-        elif prop in server:
-            return server[prop]
-        else:
-            return None
-    else:
-        if prop in server:
-            return server[prop]
-        else:
-            return None
+                        if prop not in ('server_name', 'name', 'mounted_time'):
+                            write_output(f"  {prop}: {alias[prop]}")
+
+            write_output('')
+
+
+resolved_servers = None
+
+def resolve_servers():
+    """
+    Returns every server and alias by name, resolved once per config load.
+    Batch commands and list use this instead of resolving entries one by one.
+    """
+    global resolved_servers
+    servers = resolved_servers
+    if servers is None:
+        # Under the lock, so a reload can't swap the config while it is read
+        with config_lock:
+            if resolved_servers is None:
+                servers = {}
+                for name, server in config['servers'].items():
+                    servers[name] = Server.from_config(name, server)
+                for name, alias in config['aliases'].items():
+                    if alias['server_name'] in config['servers']:
+                        servers[name] = Server.from_config(name, config['servers'][alias['server_name']], alias)
+                resolved_servers = servers
+            servers = resolved_servers
+    return servers
+
+builtin_profiles = {
+    # Fast, trusted network: no compression, a cheap cipher, aggressive caching
+    'lan-bulk': ['cache=yes', 'kernel_cache', 'Compression=no', 'Ciphers=aes128-gcm@openssh.com', 'reconnect', 'ServerAliveInterval=15', 'ServerAliveCountMax=3'],
+    # High latency: compress, cache metadata longer, survive drops
+    'wan-interactive': ['cache=yes', 'cache_timeout=120', 'Compression=yes', 'reconnect', 'ServerAliveInterval=15', 'ServerAliveCountMax=3'],
+}
+
+def get_profiles():
+    """Built-in profiles, overridden by the ones in the config."""
+    return dict(builtin_profiles, **config.get('profiles', {}))
+
+def profile_options(name):
+    if name is None:
+        return []
+    profiles = get_profiles()
+    if name not in profiles:
+        print_styled(f"Profile \"{name}\" does not exist, mounting without it.", "yellow")
+        return []
+    return profiles[name]
 
 def get_server(index = 2, server_name = None):
     if index is not None and server_name is None:
         try:
-            server_name = sys.argv[index]
+            server_name = command_args()[index]
         except IndexError:
             print_styled("No server given.", "red")
             sys.exit(0)
 
-    if server_name not in config['servers'] and server_name not in config['aliases']:
-        print_styled( f"Server \"{server_name}\" does not exist.", "red")
+    try:
+        return find_server(server_name)
+    except ServerNotFound as e:
+        print_styled(str(e), "red")
         sys.exit(0)
 
-    alias = None
-    if server_name in config['aliases']:
-        is_alias = True
-        alias = config['aliases'][server_name]
+def find_server(name):
+    """Returns the resolved server or alias called name, or raises ServerNotFound."""
+    servers = resolve_servers()
+    if name not in servers:
+        raise ServerNotFound(f"Server \"{name}\" does not exist.")
+    return servers[name]
+
+
+def save_config(change):
+    """
+    Applies change(config) to config.json. The file is read again under the
+    lock first, so what other mnt processes wrote since this one loaded it is
+    kept, not overwritten. The loaded config is replaced with the result.
+    """
+    global resolved_servers, mount_path_index
+    with config_lock, file_lock(config_path):
+        try:
+            with open(config_path) as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            current = dict(config)
+        for section in ('servers', 'aliases', 'groups', 'profiles'):
+            current.setdefault(section, {})
+        change(current)
+        write_json_atomic(config_path, current)
+        config.clear()
+        config.update(current)
+        # Resolved entries may depend on what just changed
+        resolved_servers = None
+        mount_path_index = None
+
+def unescape_mountinfo(field):
+    """Decodes the octal escapes (e.g. \\040 for a space) used in mountinfo."""
+    if '\\' not in field:
+        return field
+    return field.encode().decode('unicode_escape').encode('latin-1').decode(errors='replace')
+
+def read_mountinfo(path = '/proc/self/mountinfo'):
+    """Returns {mount point: (filesystem type, source)} for every mount."""
+    mounts = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                try:
+                    separator = fields.index('-', 6)
+                    mounts[unescape_mountinfo(fields[4])] = (fields[separator + 1], unescape_mountinfo(fields[separator + 2]))
+                except (ValueError, IndexError):
+                    # Not a mount line, e.g. cut short
+                    continue
+    except OSError:
+        pass
+    return mounts
+
+def read_listening_ports(paths = ('/proc/net/tcp', '/proc/net/tcp6')):
+    """Returns the local TCP ports something is listening on."""
+    ports = set()
+    for path in paths:
+        try:
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # State 0A is LISTEN
+                    try:
+                        if fields[3] == '0A':
+                            ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+                    except (ValueError, IndexError):
+                        continue
+        except (OSError, StopIteration):
+            pass
+    return ports
+
+class MountSnapshot:
+    """
+    What is actually mounted and listening right now, read once from /proc.
+    Nothing here touches the mount points themselves, so it can't hang on a
+    dead FUSE mount.
+    """
 
-    if server_name in config['servers']:
-        is_alias = False
-        server = config['servers'][server_name]
+    def __init__(self):
+        self.mounts = read_mountinfo()
+        self.ports = read_listening_ports()
 
-    if is_alias:
-        server = config['servers'][alias['server_name']]
+    def mount_of(self, server):
+        """Returns (filesystem type, source) mounted at the server's mount path, or None."""
+        if server.get('mount_path') is None:
+            return None
+        return self.mounts.get(normalize_path(server.get('mount_path')))
 
-    aliased_properties = []
-    name = server_name
-    if is_alias:
-        parent_name = alias['server_name']
+    def tunnel_up(self, server):
+        if server.get('tunnel_port') is None:
+            return None
+        try:
+            return int(server.get('port')) in self.ports
+        except (TypeError, ValueError):
+            return False
+
+    def status(self, server):
+        """
+        mounted, unmounted, stale or mirror. Stale means mnt mounted it but it is
+        gone, or it is mounted but its tunnel is down.
+        """
+        if server.get('mode') == 'mirror':
+            return 'mirror'
+        mounted = self.mount_of(server) is not None
+        tunnel = self.tunnel_up(server)
+        if mounted:
+            return 'stale' if tunnel is False else 'mounted'
+        if get_state(server.name, 'mounted') or tunnel:
+            return 'stale'
+        return 'unmounted'
+
+def port_open(port, host = '127.0.0.1', timeout = 0.2):
+    """Whether something accepts connections on the local port."""
+    try:
+        with socket.create_connection((host, int(port)), timeout):
+            return True
+    except (OSError, TypeError, ValueError):
+        return False
+
+def wait_for_port(port, timeout, host = '127.0.0.1'):
+    """
+    Polls the port with connect attempts that back off from 20 ms to 500 ms.
+
+    Returns the seconds it took until the port accepted a connection, or None
+    if it did not within timeout seconds.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    delay = 0.02
+    while True:
+        if port_open(port, host, min(max(time_left(deadline), 0.01), 0.5)):
+            return time.monotonic() - start
+        if time.monotonic() + delay > deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+def is_tunnel_process(pid, port):
+    """Whether pid is still an ssh process forwarding port, and not an unrelated one."""
+    try:
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            args = f.read().decode(errors='replace').split('\0')
+    except OSError:
+        return False
+    return os.path.basename(args[0]) == 'ssh' and any(arg.startswith(f"{port}:") for arg in args)
+
+health_timeout = 5.0
+health_slow_seconds = 1.0
+# Runs in a child process, so a stat that never returns can be killed
+probe_code = "import os, sys; os.stat(sys.argv[1]); os.listdir(sys.argv[1])"
+
+def probe_mount(path, timeout = None):
+    """
+    Stats and lists path in a separate process with a hard deadline.
+
+    Returns (health, seconds), where health is healthy, slow, hung (no answer
+    before the deadline) or broken (failed, e.g. transport endpoint not connected).
+    """
+    timeout = health_timeout if timeout is None else timeout
+    start = time.monotonic()
+    process = get_executor().spawn(
+        [sys.executable, '-I', '-S', '-c', probe_code, path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # A process stuck on a FUSE request only dies on SIGKILL, and may not
+        # even then, so don't wait for it
+        process.kill()
+        return 'hung', timeout
+    elapsed = time.monotonic() - start
+    if process.returncode != 0:
+        return 'broken', elapsed
+    return ('slow' if elapsed > health_slow_seconds else 'healthy'), elapsed
+
+def probe_servers(servers, jobs = 16, timeout = None):
+    """Probes the mount path of every server in parallel. Returns {name: (health, seconds)}."""
+    with futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        probes = {server.name: pool.submit(in_context(probe_mount), server.get('mount_path'), timeout) for server in servers}
+        results = {name: probe.result() for name, probe in probes.items()}
+    for name, (health, seconds) in results.items():
+        set_state(name, health = health, health_time = int(time.time()))
+    return results
+
+def mount_health():
+    names, jobs, timeout, _ = parse_batch_args(command_args()[2:], jobs = 16)
+    if '--all' in names:
+        names = list(config['servers']) + list(config['aliases'])
+    elif names:
+        names = expand_groups(names)
     else:
-        parent_name = None
-    command = get_server_or_alias_prop('command', server, alias, aliased_properties)
-    unmount_command = get_server_or_alias_prop('unmount_command', server, alias, aliased_properties)
-    append_mount_path = get_server_or_alias_prop('append_mount_path', server, alias, aliased_properties)
-    mounted_time = get_server_or_alias_prop('mounted_time', server, alias, aliased_properties)
-    mount_path = get_server_or_alias_prop('mount_path', server, alias, aliased_properties)
-    host = get_server_or_alias_prop('host', server, alias, aliased_properties)
-    key_path = get_server_or_alias_prop('key_path', server, alias, aliased_properties)
-    remote_dir = get_server_or_alias_prop('remote_dir', server, alias, aliased_properties)
-    pre_command = get_server_or_alias_prop('pre_command', server, alias, aliased_properties)
-    shell = get_server_or_alias_prop('shell', server, alias, aliased_properties)
-    port = get_server_or_alias_prop('port', server, alias, aliased_properties)
-    tunnel_port = get_server_or_alias_prop('tunnel_port', server, alias, aliased_properties)
-    tunnel_host = get_server_or_alias_prop('tunnel_host', server, alias, aliased_properties)
-    tunnel_key_path = get_server_or_alias_prop('tunnel_key_path', server, alias, aliased_properties)
-    tunnel_username = get_server_or_alias_prop('tunnel_username', server, alias, aliased_properties)
-    tunnel_forwarded_host = get_server_or_alias_prop('tunnel_forwarded_host', server, alias, aliased_properties)
-
-    return Server(
-            name,
-            parent_name,
-            command,
-            unmount_command,
-            append_mount_path,
-            mounted_time,
-            mount_path,
-            is_alias,
-            aliased_properties,
-            host,
-            key_path,
-            remote_dir,
-            pre_command,
-            shell,
-            port,
-            tunnel_port,
-            tunnel_host,
-            tunnel_key_path,
-            tunnel_username,
-            tunnel_forwarded_host
-            )
+        last = last_mounted_server()
+        if last is None:
+            print_styled('Usage: mnt health [<name|group> ...|--all] [--timeout S]', "red")
+            sys.exit(0)
+        names = [last]
+    check_server_names(names)
+
+    snapshot = MountSnapshot()
+    servers = [get_server(None, name) for name in names]
+    mounted = [server for server in servers if snapshot.mount_of(server) is not None]
+    results = probe_servers(mounted, jobs, timeout)
+
+    width = max([len(name) for name in names] + [6])
+    styles = {'healthy': 'green', 'slow': 'yellow', 'hung': 'red', 'broken': 'red', 'unmounted': None}
+    print_styled(f"{'Server'.ljust(width)}  {'Health'.ljust(9)}  Time", "bold")
+    unhealthy = 0
+    for name in names:
+        health, seconds = results.get(name, ('unmounted', None))
+        if health in ('hung', 'broken'):
+            unhealthy += 1
+        elapsed = f"{seconds:.2f}s" if seconds is not None else '-'
+        print_styled(f"{name.ljust(width)}  {health.ljust(9)}  {elapsed}", styles[health])
+    sys.exit(1 if unhealthy else 0)
+
+warm_depth = 8
+warm_limit = 100000
+warm_jobs = 16
+
+def warm_tree(roots, depth = warm_depth, limit = warm_limit, jobs = warm_jobs):
+    """
+    Lists and stats everything below roots, up to depth directories down and
+    limit entries in total, on jobs threads, so sshfs and the kernel cache
+    the attributes and directory listings. Returns (entries, directories, complete).
+    """
+    def scan(path):
+        subdirs = []
+        count = 0
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    count += 1
+                    try:
+                        entry.stat(follow_symlinks=False)
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return count, subdirs
+
+    visited = 0
+    directories = 0
+    complete = True
+    with futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        scan = in_context(scan)
+        pending = {pool.submit(scan, root): 0 for root in roots}
+        while pending:
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                level = pending.pop(future)
+                count, subdirs = future.result()
+                visited += count
+                directories += 1
+                if visited >= limit:
+                    complete = False
+                    continue
+                if level >= depth:
+                    complete = complete and not subdirs
+                    continue
+                for subdir in subdirs:
+                    pending[pool.submit(scan, subdir)] = level + 1
+            if visited >= limit:
+                # Let running scans finish, but start no new ones
+                for future in pending:
+                    future.cancel()
+                pending = {future: level for future, level in pending.items() if not future.cancelled()}
+    return visited, directories, complete
+
+def start_warm(server):
+    """Warms the server's warm_paths in the background, so mount returns right away."""
+    get_executor().spawn(
+        [sys.executable, os.path.abspath(__file__), 'warm', server.name],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    print_styled(f"Warming {', '.join(server.get('warm_paths'))} in the background.", "italic")
+
+def warm_command():
+    usage = 'Usage: mnt warm <name> [<path> ...] [--depth N] [--limit N] [--jobs N]'
+    args = command_args()[2:]
+    options = {'--depth': warm_depth, '--limit': warm_limit, '--jobs': warm_jobs}
+    names = []
+    while args:
+        arg = args.pop(0)
+        if arg in options:
+            try:
+                options[arg] = max(int(args.pop(0)), 0 if arg == '--depth' else 1)
+            except (IndexError, ValueError):
+                print_styled(f"Option {arg} needs a numeric value.", "red")
+                sys.exit(1)
+        else:
+            names.append(arg)
+    if not names:
+        print_styled(usage, "red")
+        sys.exit(0)
+
+    server = get_server(None, names[0])
+    mount_path = os.path.expanduser(server.get('mount_path'))
+    if server.get('mode') != 'mirror':
+        if MountSnapshot().mount_of(server) is None:
+            print_styled(f"\"{server.name}\" is not mounted.", "red")
+            sys.exit(1)
+        health, _ = probe_mount(mount_path)
+        if health in ('hung', 'broken'):
+            print_styled(f"Mount is {health}, not warming it.", "red")
+            sys.exit(1)
+    paths = names[1:] or server.get('warm_paths') or ['.']
+    roots = [os.path.normpath(os.path.join(mount_path, path.lstrip('/'))) for path in paths]
+
+    start = time.monotonic()
+    entries, directories, complete = warm_tree(roots, options['--depth'], options['--limit'], options['--jobs'])
+    seconds = time.monotonic() - start
+    set_state(server.name, warm_entries = entries, warm_seconds = round(seconds, 3), warm_time = int(time.time()))
+    print_styled(f"Visited {entries} entries in {directories} directories in {seconds:.2f}s ({entries / max(seconds, 1e-6):.0f}/s)", "green")
+    if not complete:
+        print_styled(f"Stopped at the depth or entry limit (--depth {options['--depth']}, --limit {options['--limit']}).", "yellow")
+    sys.exit(0)
+
+def server_status(server, snapshot):
+    """
+    Returns {'state': ..., 'tunnel': ..., 'mount': ...} for server: its
+    MountSnapshot status, whether its tunnel is up (None without one), and
+    the (filesystem type, source) mounted at its mount path, or None.
+    """
+    return {'state': snapshot.status(server), 'tunnel': snapshot.tunnel_up(server), 'mount': snapshot.mount_of(server)}
+
+def mount_status(manager):
+    check_server_names(expand_groups(command_args()[2:]))
+    statuses = manager.status(command_args()[2:])
+    width = max([len(name) for name in statuses] + [6])
+    styles = {'mounted': 'green', 'unmounted': None, 'stale': 'red', 'mirror': 'cyan'}
+    print_styled(f"{'Server'.ljust(width)}  {'State'.ljust(9)}  {'Tunnel'.ljust(6)}  Mount", "bold")
+    for name, status in statuses.items():
+        tunnel = {None: '-', True: 'up', False: 'down'}[status['tunnel']]
+        mount = f"{status['mount'][1]} ({status['mount'][0]})" if status['mount'] else '-'
+        print_styled(f"{name.ljust(width)}  {status['state'].ljust(9)}  {tunnel.ljust(6)}  {mount}", styles[status['state']])
+    sys.exit(0)
+
+class file_lock:
+    """Holds an exclusive lock on path.lock, shared with other mnt processes."""
+
+    def __init__(self, path):
+        self.path = path + '.lock'
 
+    def __enter__(self):
+        self.lock = open(self.path, 'a')
+        fcntl.flock(self.lock, fcntl.LOCK_EX)
 
-def save_config():
-    with open(config_path, 'w') as f:
-        json.dump(config, f)
-    return True
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.lock, fcntl.LOCK_UN)
+        self.lock.close()
+
+def write_json_atomic(path, data):
+    """Writes data to a temporary file and renames it over path, so readers
+    never see a partly written file."""
+    write_atomic(path, json.dumps(data).encode())
+
+def write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def config_signature():
+    stat = os.stat(config_path)
+    return stat.st_mtime_ns, stat.st_size
+
+# Resolved servers and aliases are also compiled into config.cache: an 8 byte
+# header length, a marshalled (version, config signature, {name: (offset,
+# size)}) header, then one marshalled record per entry. Hot commands read the
+# header and a single record instead of parsing config.json.
+cache_fields = ["name", "parent_name", "is_alias", "aliased_properties"] + [prop for prop in Server.prop_list if prop not in ("name", "mounted_time")]
+
+def write_config_cache(signature):
+    records = []
+    offsets = {}
+    position = 0
+    for name, server in resolve_servers().items():
+        record = marshal.dumps({field: server.get(field) for field in cache_fields})
+        offsets[name] = (position, len(record))
+        position += len(record)
+        records.append(record)
+    header = marshal.dumps((cache_version, signature, offsets))
+    write_atomic(cache_path, len(header).to_bytes(8, 'big') + header + b''.join(records))
+
+def read_cache_header(f):
+    size = int.from_bytes(f.read(8), 'big')
+    return marshal.loads(f.read(size))
+
+def update_config_cache(signature):
+    try:
+        with open(cache_path, 'rb') as f:
+            version, cached_signature, _ = read_cache_header(f)
+        if version == cache_version and cached_signature == signature:
+            return
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    try:
+        write_config_cache(signature)
+    except OSError:
+        pass
+
+def load_cached_server(name):
+    """Returns the Server for name from config.cache, or None if the cache is stale."""
+    try:
+        signature = config_signature()
+        with open(cache_path, 'rb') as f:
+            version, cached_signature, offsets = read_cache_header(f)
+            if version != cache_version or cached_signature != signature or name not in offsets:
+                return None
+            offset, size = offsets[name]
+            f.seek(offset, os.SEEK_CUR)
+            record = marshal.loads(f.read(size))
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    return Server(**record)
+
+# Runtime state (mount times, tunnels, health) is kept out of config.json in an
+# append-only log of {"name": ..., <key>: <value>} lines; later lines win.
+state = None
+
+def read_state_log():
+    """Returns the folded state log and the number of lines it had."""
+    values = {}
+    lines = 0
+    try:
+        with open(state_path) as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                values.setdefault(entry.pop('name'), {}).update(entry)
+    except OSError:
+        pass
+    return values, lines
+
+def load_state():
+    global state
+    if state is None:
+        state, lines = read_state_log()
+        if lines > state_compact_lines:
+            compact_state()
+    return state
+
+def refresh_state():
+    """Drops the cached state, so the next read sees what other processes wrote."""
+    global state
+    state = None
+
+def compact_state():
+    """Rewrites the state log with one line per server."""
+    with config_lock, file_lock(state_path):
+        # Read again under the lock, to keep lines other processes just added
+        values, _ = read_state_log()
+        fd, temp_path = tempfile.mkstemp(dir=config_folder, prefix='.state.jsonl.')
+        with os.fdopen(fd, 'w') as f:
+            for name, entry in values.items():
+                f.write(json.dumps(dict(entry, name=name)) + '\n')
+        os.replace(temp_path, state_path)
+
+def get_state(name, key, default = None):
+    return load_state().get(name, {}).get(key, default)
+
+def set_state(name, **values):
+    with config_lock:
+        load_state().setdefault(name, {}).update(values)
+        with file_lock(state_path), open(state_path, 'a') as f:
+            f.write(json.dumps(dict(values, name=name)) + '\n')
 
 def add_server():
 
     print_styled('Adding new server. You will be guided through it.', "bold")
 
     server_name = "" 
-    while server_name in config['servers'] or server_name in config['aliases'] or server_name == "":
+    while server_name in config['servers'] or server_name in config['aliases'] or server_name in config['groups'] or server_name == "":
         server_name = input("Enter server name: ")
 
         if server_name in config['servers'] or server_name in config['aliases']:
             print_styled(f"Server \"{server_name}\" already exists. Try another.", "red")
+        elif server_name in config['groups']:
+            print_styled(f"\"{server_name}\" is already a group name. Try another.", "red")
 
 
     command = ""
@@ -472,23 +1531,19 @@ def add_server():
 
     server = Server(
             server_name,
-            None,
-            command,
-            unmount_command,
-            append_mount_path,
-            None,
-            mount_path,
-            False,
-            [],
-            host,
-            key_path,
-            remote_dir,
-            pre_command,
-            shell,
-            port
+            command=command,
+            unmount_command=unmount_command,
+            append_mount_path=append_mount_path,
+            mount_path=mount_path,
+            host=host,
+            key_path=key_path,
+            remote_dir=remote_dir,
+            pre_command=pre_command,
+            shell=shell,
+            port=port
             )
 
-    server.save_server()
+    server.save_server([prop for prop in Server.prop_list if prop != 'mounted_time'])
 
     do_tunnel = ""
     while do_tunnel == "":
@@ -506,7 +1561,7 @@ def add_alias():
         servers = []
         for i, server_name in enumerate(config['servers']):
             servers.append(server_name)
-            print(f"{i+1}) {server_name}")
+            write_output(f"{i+1}) {server_name}")
         server_name = input("Choose which server you want to create alias for: ")
         server_name = servers[int(server_name) - 1]
     except IndexError:
@@ -518,31 +1573,37 @@ def add_alias():
     while alias == "":
         alias = input("Enter alias name: ")
 
-        if alias in config['aliases']:
+        if alias in config['aliases'] or alias in config['servers']:
             print_styled(f"Alias \"{alias}\" already exists. Try another.", "red")
             alias = ""
+        elif alias in config['groups']:
+            print_styled(f"\"{alias}\" is already a group name. Try another.", "red")
+            alias = ""
 
 
 
-    config['aliases'][alias] = {
+    entry = {
             'name': alias,
             'server_name': server_name
             }
 
-    print('Alias setup only includes changing the remote directory and mount path. However, using mnt update you can change any other property.')
+    write_output('Alias setup only includes changing the remote directory and mount path. However, using mnt update you can change any other property.')
 
     remote_dir = ""
     while remote_dir == "":
         remote_dir = input("Enter remote directory: (e.g. /var/www/public_html) ")
-        config['aliases'][alias]['remote_dir'] = remote_dir
+        entry['remote_dir'] = remote_dir
 
     mount_path = ""
     while mount_path == "":
         mount_path = input("Enter mount path: (e.g. /mnt) ")
-        config['aliases'][alias]['mount_path'] = mount_path
+        entry['mount_path'] = mount_path
+
+    def change(current):
+        current['aliases'][alias] = entry
 
+    save_config(change)
     print_styled(f"Added alias \"{alias}\" for server \"{server_name}\"", "green")
-    save_config()
     sys.exit(0)
 
 def add_tunnel(server_name = None, exit = True):
@@ -551,7 +1612,7 @@ def add_tunnel(server_name = None, exit = True):
             servers = []
             for i, server_name in enumerate(config['servers']):
                 servers.append(server_name)
-                print(f"{i+1}) {server_name}")
+                write_output(f"{i+1}) {server_name}")
             server_name = input("Choose which server you want to add tunnel to: ")
             server_name = servers[int(server_name) - 1]
         except IndexError:
@@ -576,102 +1637,188 @@ def add_tunnel(server_name = None, exit = True):
     if tunnel_key_path == "":
         tunnel_key_path = None
 
-    server.set('tunnel_port', tunnel_port)
-    server.set('tunnel_host', tunnel_host)
-    server.set('tunnel_key_path', tunnel_key_path)
-    server.set('tunnel_username', tunnel_username)
+    server.set('tunnel_port', tunnel_port, False)
+    server.set('tunnel_host', tunnel_host, False)
+    server.set('tunnel_key_path', tunnel_key_path, False)
+    server.set('tunnel_username', tunnel_username, False)
+    server.save_server()
 
     print_styled(f"Added tunnel for server \"{server.name}\"", "green")
 
     if exit:
         sys.exit(0)
 
-def unmount_server():
-    if sys.argv[2] == "all":
-        print_styled('Unmounting all servers', 'bold')
-        for server_name in config['servers']:
-            print_styled(f"Unmounting server \"{server_name}\"", "cyan")
-            server = get_server(None, server_name)
-            try:
-                server.unmount(False, True)
-            except Exception:
-                continue
-        for alias in config['aliases']:
-            server = get_server(None, alias)
-            print_styled(f"Unmounting server \"{alias}\"", "cyan")
-            try:
-                server.unmount(False, True)
-            except Exception:
-                continue
+def parse_batch_args(args, jobs = 8, timeout = None):
+    """
+    Splits --jobs N, --timeout S and --stream off args.
+    Returns (names, jobs, timeout, stream).
+    """
+    names = []
+    stream = False
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        try:
+            if arg == '--stream':
+                stream = True
+            elif arg == '--jobs':
+                jobs = int(args.pop(0))
+            elif arg == '--timeout':
+                timeout = float(args.pop(0))
+            else:
+                names.append(arg)
+        except (IndexError, ValueError):
+            print_styled(f"Option {arg} needs a numeric value.", "red")
+            sys.exit(1)
+    return names, max(jobs, 1), timeout, stream
+
+def check_server_names(names):
+    try:
+        require_servers(names)
+    except ServerNotFound as e:
+        print_styled(str(e), "red")
+        sys.exit(1)
+
+def require_servers(names):
+    """Raises ServerNotFound for the first name that is not a server or alias."""
+    for name in names:
+        if name not in config['servers'] and name not in config['aliases']:
+            raise ServerNotFound(f"Server \"{name}\" does not exist.")
+
+def expand_groups(names):
+    """Replaces group names with their members, dropping duplicates."""
+    expanded = []
+    for name in names:
+        members = config['groups'].get(name, [name])
+        for member in members:
+            if member not in expanded:
+                expanded.append(member)
+    return expanded
+
+def run_batch(names, action, jobs = 8, summary = True, stream = False):
+    """
+    Runs action(server) for every name on a pool of at most jobs workers.
+    Output is printed per server as each one finishes, or live with a server
+    name prefix on every line if stream is set, followed by a summary.
+
+    Returns a Result per server, in the order they finished. Its output is
+    empty if stream is set.
+    """
+    def work(name):
+        if stream:
+            output_context.prefix = name
+        else:
+            output_context.lines = []
+        started = time.time()
+        start = time.monotonic()
+        try:
+            status = action(get_server(None, name))
+        except Exception as e:
+            print_styled(f"Error: {e}", "red")
+            status = 1
+        output = '' if stream else ''.join(output_context.lines)
+        return Result(name, status, output, started, time.monotonic() - start)
+
+    results = []
+    with futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = [pool.submit(in_context(work), name) for name in names]
+        for future in futures.as_completed(pending):
+            result = future.result()
+            if not stream:
+                print_styled(f"--- {result.name} ---", "cyan")
+                write_output(result.output, end='')
+            results.append(result)
+
+    if summary:
+        print_batch_summary(results)
+    return results
+
+def print_batch_summary(results):
+    width = max([len(result.name) for result in results] + [6])
+    print_styled(f"\n{'Server'.ljust(width)}  Result   Exit  Time", "bold")
+    failed = 0
+    for result in sorted(results, key=lambda result: result.name):
+        if result.code == 0:
+            outcome, style = 'ok', 'green'
+        elif result.code == 124:
+            outcome, style = 'timeout', 'red'
+        else:
+            outcome, style = 'failed', 'red'
+        if result.code != 0:
+            failed += 1
+        print_styled(f"{result.name.ljust(width)}  {outcome.ljust(7)}  {str(result.code).rjust(4)}  {result.duration:.2f}s", style)
+    print_styled(f"{len(results) - failed} succeeded, {failed} failed", "bold")
+    if failed:
+        codes = {}
+        for result in results:
+            codes[result.code] = codes.get(result.code, 0) + 1
+        write_output(', '.join(f"exit {code}: {count}" for code, count in sorted(codes.items())))
+
+def unmount_server(manager):
+    names, jobs, timeout, stream = parse_batch_args(command_args()[2:], timeout = 30)
+    if not names:
+        print_styled('No server given. Usage: mnt unmount <name|all> [<name> ...]', "red")
         sys.exit(0)
-    server = get_server(2)
-    server.unmount()
 
-def update_server():
-    prop_list = ["mount","unmount","mount_path","append_mount_path","host","key_path","remote_dir","pre_command","shell","port","tunnel_port","tunnel_host","tunnel_key_path","tunnel_username","tunnel_forwarded_host"]
+    if names == ["all"]:
+        print_styled('Unmounting all servers', 'bold')
+        names = list(config['servers']) + list(config['aliases'])
+    elif len(names) == 1 and names[0] not in config['groups']:
+        get_server(None, names[0])
+        sys.exit(manager.unmount(names[0], timeout = timeout).code)
+
+    check_server_names(expand_groups(names))
+    results = manager.unmount_many(names, jobs, timeout, stream)
+    sys.exit(1 if any(not result.ok for result in results) else 0)
+
+updatable_props = ["mount","unmount","mount_path","append_mount_path","host","key_path","remote_dir","pre_command","shell","port","tunnel_port","tunnel_host","tunnel_key_path","tunnel_username","tunnel_forwarded_host","control_persist","tunnel_timeout","profile","mode","include","exclude","warm_paths"]
+
+def parse_property(prop, text):
+    """Converts a property value given on the command line to the type it is stored as."""
+    if prop == "append_mount_path":
+        return text == "true" or text == "True"
+    elif prop == "tunnel_timeout":
+        try:
+            return float(text)
+        except ValueError:
+            raise InvalidValue("Tunnel timeout must be a number of seconds.")
+    elif prop == "include" or prop == "exclude" or prop == "warm_paths":
+        return [pattern for pattern in text.split(',') if pattern] or None
+    return text
+
+def update_server(manager):
     try:
-        server = sys.argv[2]
-        prop = sys.argv[3]
-        if prop not in prop_list:
-            print_styled(f"Invalid property. Must be one of: {', '.join(prop_list)}", "red")
+        server = command_args()[2]
+        prop = command_args()[3]
+        if prop not in updatable_props:
+            print_styled(f"Invalid property. Must be one of: {', '.join(updatable_props)}", "red")
             sys.exit(0)
-        server_command = " ".join(sys.argv[4:])  # Joins with spaces, no extra quotes
+        server_command = " ".join(command_args()[4:])  # Joins with spaces, no extra quotes
     except IndexError:
         print_styled('No server given. Usage: mnt update <server_name> <mount|unmount> <command>.', "red")
         sys.exit(0)
 
-    if server not in config['servers']:
+    if server not in config['servers'] and server not in config['aliases']:
         print_styled(f"Server \"{server}\" does not exist. Use command \"mnt add <server_name> <command>\" to add it.", "red")
         sys.exit(0)
 
-    if prop == 'mount':
-        config['servers'][server]['command'] = server_command
-    elif prop == 'unmount':
-        config['servers'][server]['unmount_command'] = server_command
-    elif prop == "mount_path":
-        config['servers'][server]['mount_path'] = server_command
-    elif prop == "append_mount_path":
-        if server_command == "true" or server_command == "True":
-            config['servers'][server]['append_mount_path'] = True
-        else:
-            config['servers'][server]['append_mount_path'] = False
-    elif prop == "host":
-        config['servers'][server]['host'] = server_command
-    elif prop == "key_path":
-        config['servers'][server]['key_path'] = server_command
-    elif prop == "remote_dir":
-        config['servers'][server]['remote_dir'] = server_command
-    elif prop == "pre_command":
-        config['servers'][server]['pre_command'] = server_command
-    elif prop == "shell":
-        config['servers'][server]['shell'] = server_command
-    elif prop == "port":
-        config['servers'][server]['port'] = server_command
-    elif prop == "tunnel_port":
-        config['servers'][server]['tunnel_port'] = server_command
-    elif prop == "tunnel_host":
-        config['servers'][server]['tunnel_host'] = server_command
-    elif prop == "tunnel_key_path":
-        config['servers'][server]['tunnel_key_path'] = server_command
-    elif prop == "tunnel_username":
-        config['servers'][server]['tunnel_username'] = server_command
-    elif prop == "tunnel_forwarded_host":
-        config['servers'][server]['tunnel_forwarded_host'] = server_command
-
+    try:
+        manager.update(server, prop, parse_property(prop, server_command))
+    except MntError as e:
+        print_styled(str(e), "red")
+        sys.exit(0)
 
     print_styled(f"Updated server \"{server}\" prop \"{prop}\" to \"{server_command}\"", "green")
-
-    save_config()
     sys.exit(0)
 
 def delete_server():
     try:
-        server = sys.argv[2]
+        server = command_args()[2]
     except IndexError:
         print_styled('No server given. Usage: mnt delete <server_name>. E.g. \"mnt delete sshfs\"', "red")
         sys.exit(0)
 
-    if server not in config['servers'] and server not in config['aliases']:
+    if server not in config['servers'] and server not in config['aliases'] and server not in config['groups']:
         print_styled(f"Server \"{server}\" does not exist. Use command \"mnt add <server_name> <command>\" to add it.", "red")
         sys.exit(0)
 
@@ -681,12 +1828,21 @@ def delete_server():
         if sure == "n" or sure == "N":
             sys.exit(0)
 
-    if server in config['aliases']:
-        del config['aliases'][server]
-    elif server in config['servers']:
-        del config['servers'][server]
-
-    save_config()
+    def delete(current):
+        if server in current['groups']:
+            del current['groups'][server]
+            return
+        current['aliases'].pop(server, None)
+        current['servers'].pop(server, None)
+        # Groups would otherwise fail on the missing member from now on
+        for group, members in list(current['groups'].items()):
+            if server in members:
+                members.remove(server)
+                if not members:
+                    del current['groups'][group]
+                    print_styled(f"Deleted group \"{group}\", which has no members left.", "italic")
+
+    save_config(delete)
 
     print_styled(f"Deleted server \"{server}\"", "green")
 
@@ -694,19 +1850,390 @@ def delete_server():
 
 def list_servers():
     print_styled('\nmnt servers:\n', "bold")
+    aliases = {}
+    for alias in config['aliases'].values():
+        aliases.setdefault(alias['server_name'], []).append(alias)
     for server in config['servers']:
         server = get_server(None, server)
-        server.list()
+        server.list(aliases.get(server.name, []))
+
+    if config['groups']:
+        print_styled('mnt groups:\n', "bold")
+        for group, members in config['groups'].items():
+            write_output(f"{group}: {' '.join(members)}")
+        write_output('')
+
+    sys.exit(0)
+
+def mount_batch(names, jobs = 8, timeout = None, stream = False, snapshot = None, summary = True):
+    """
+    Opens the tunnels of names, once per distinct tunnel, then mounts them.
+    Mounts behind a tunnel that failed are not attempted.
+
+    Returns a Result per server.
+    """
+    snapshot = snapshot or MountSnapshot()
+    tunnels = {}
+    for name in names:
+        server = get_server(None, name)
+        if server.get('tunnel_port') is not None:
+            tunnels.setdefault(server.tunnel_key(), name)
+
+    failed_tunnels = set()
+    if tunnels:
+        print_styled(f"Setting up {len(tunnels)} tunnel(s)", 'bold')
+        tunnel_owners = {name: key for key, name in tunnels.items()}
+        for result in run_batch(list(tunnels.values()), lambda server: server.setup_tunnel(timeout), jobs, False, stream):
+            if not result.ok:
+                failed_tunnels.add(tunnel_owners[result.name])
+
+    def mount_one(server):
+        if server.get('tunnel_port') is not None:
+            if server.tunnel_key() in failed_tunnels:
+                print_styled("Skipped: tunnel could not be set up.", "red")
+                return 1
+            server.claim_tunnel()
+        return server.mount(not stream, tunnel = False, timeout = timeout, snapshot = snapshot)
+
+    print_styled(f"Mounting {len(names)} server(s)", 'bold')
+    return run_batch(names, mount_one, jobs, summary, stream)
+
+def mount_command(manager):
+    names, jobs, timeout, stream = parse_batch_args(command_args()[2:])
+    if not names:
+        print_styled('No server given. Usage: mnt mount <server_name|group> [<server_name> ...]. E.g. \"mnt mount sshfs\"', "red")
+        sys.exit(0)
+    if len(names) == 1 and names[0] not in config['groups']:
+        server = names[0]
+        # One server mounts with its output live, so only --timeout applies
+        if server in config['servers'] or server in config['aliases']:
+            sys.exit(manager.mount(server, timeout = timeout).code)
+        else:
+            print_styled(f"Server \"{server}\" does not exist. Use command \"mnt add <server_name> <command>\" to add it.", "red")
+            sys.exit(0)
+    check_server_names(expand_groups(names))
+    results = manager.mount_many(names, jobs, timeout, stream)
+    sys.exit(1 if any(not result.ok for result in results) else 0)
+
+watch_interval = 30.0
+watch_backoff_base = 5.0
+watch_backoff_max = 600.0
+
+def watch_log(message, style = None):
+    """Prints a watchdog event and appends it to watch.log."""
+    line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}"
+    print_styled(line, style)
+    with open(watch_log_path, 'a') as f:
+        f.write(line + '\n')
+
+def watch_backoff(failures):
+    """Seconds to wait after failures failed remounts: exponential, with jitter."""
+    delay = min(watch_backoff_base * 2 ** (failures - 1), watch_backoff_max)
+    return delay * random.uniform(0.5, 1.0)
+
+def watch_check(servers, jobs, timeout):
+    """
+    Returns {name: reason} for the servers that mnt mounted but that are gone,
+    hung, broken or behind a tunnel that is down.
+    """
+    snapshot = MountSnapshot()
+    lost = {}
+    mounted = []
+    for server in servers:
+        if not get_state(server.name, 'mounted'):
+            continue
+        if snapshot.tunnel_up(server) is False:
+            lost[server.name] = 'tunnel down'
+        elif snapshot.mount_of(server) is None:
+            lost[server.name] = 'not mounted'
+        else:
+            mounted.append(server)
+    for name, (health, _) in probe_servers(mounted, jobs, timeout).items():
+        if health in ('hung', 'broken'):
+            lost[name] = health
+    return lost
+
+def watch_servers():
+    """
+    Remounts servers that mnt mounted when they drop, until interrupted.
+    Servers that fail to remount are retried with exponential backoff.
+    """
+    args = command_args()[2:]
+    interval = watch_interval
+    if '--interval' in args:
+        i = args.index('--interval')
+        try:
+            interval = float(args[i + 1])
+        except (IndexError, ValueError):
+            print_styled("Option --interval needs a numeric value.", "red")
+            sys.exit(1)
+        del args[i:i + 2]
+    names, jobs, timeout, _ = parse_batch_args(args, jobs = 4, timeout = health_timeout)
+    if not names or '--all' in names:
+        names = list(config['servers']) + list(config['aliases'])
+    else:
+        names = expand_groups(names)
+    check_server_names(names)
+    servers = [get_server(None, name) for name in names]
+
+    watch_log(f"Watching {len(names)} server(s) every {interval:g}s", "bold")
+    failures = {}
+    retry_at = {}
+    try:
+        while True:
+            # Pick up mounts and unmounts done by other mnt processes
+            refresh_state()
+            lost = watch_check(servers, jobs, timeout)
+            for name in list(failures):
+                if name not in lost:
+                    watch_log(f"{name}: recovered", "green")
+                    del failures[name], retry_at[name]
+            now = time.monotonic()
+            due = []
+            for name, reason in lost.items():
+                if retry_at.get(name, 0) <= now:
+                    watch_log(f"{name}: {reason}, remounting", "yellow")
+                    due.append(name)
+            if due:
+                for result in mount_batch(due, jobs, timeout, summary = False):
+                    name = result.name
+                    if result.ok:
+                        watch_log(f"{name}: remounted in {result.duration:.1f}s", "green")
+                        failures.pop(name, None)
+                        retry_at.pop(name, None)
+                    else:
+                        failures[name] = failures.get(name, 0) + 1
+                        delay = watch_backoff(failures[name])
+                        retry_at[name] = time.monotonic() + delay
+                        watch_log(f"{name}: remount failed with exit code {result.code}, retrying in {delay:.0f}s", "red")
+            wake = min([time.monotonic() + interval] + list(retry_at.values()))
+            time.sleep(max(wake - time.monotonic(), 0))
+    except KeyboardInterrupt:
+        watch_log("Stopped watching", "bold")
+
+def group_servers():
+    try:
+        group = command_args()[2]
+    except IndexError:
+        if not config['groups']:
+            write_output('No groups. Usage: mnt group <group_name> <server_name> [<server_name> ...]')
+        for group, members in config['groups'].items():
+            write_output(f"{group}: {' '.join(members)}")
+        sys.exit(0)
+
+    members = command_args()[3:]
+    if not members:
+        if group not in config['groups']:
+            print_styled(f"Group \"{group}\" does not exist.", "red")
+            sys.exit(0)
+        write_output(' '.join(config['groups'][group]))
+        sys.exit(0)
+
+    if group in config['servers'] or group in config['aliases']:
+        print_styled(f"\"{group}\" is already a server or alias name. Try another.", "red")
+        sys.exit(0)
+    check_server_names(members)
+    def change(current):
+        current['groups'][group] = members
+
+    save_config(change)
+    print_styled(f"Set group \"{group}\" to {', '.join(members)}", "green")
+    sys.exit(0)
+
+def profile_command():
+    try:
+        profile = command_args()[2]
+    except IndexError:
+        for profile, options in get_profiles().items():
+            builtin = ' (built-in)' if profile in builtin_profiles and profile not in config['profiles'] else ''
+            write_output(f"{profile}{builtin}: {' '.join(options)}")
+        sys.exit(0)
+
+    options = command_args()[3:]
+    if not options:
+        if profile not in get_profiles():
+            print_styled(f"Profile \"{profile}\" does not exist.", "red")
+            sys.exit(0)
+        write_output(' '.join(get_profiles()[profile]))
+        sys.exit(0)
+
+    if options == ['--delete']:
+        if profile not in config['profiles']:
+            print_styled(f"Profile \"{profile}\" is not in the config.", "red")
+            sys.exit(0)
+        def delete(current):
+            current['profiles'].pop(profile, None)
 
+        save_config(delete)
+        print_styled(f"Deleted profile \"{profile}\"", "green")
+        sys.exit(0)
+
+    def change(current):
+        current['profiles'][profile] = options
+
+    save_config(change)
+    print_styled(f"Set profile \"{profile}\" to {' '.join(options)}", "green")
     sys.exit(0)
 
-def mount(config_server):
-    server = get_server(None, config_server['name'])
-    server.mount()
+bench_block = 1024 * 1024
+
+def bench_server(server, profile):
+    """A copy of server that mounts with profile at a fresh temporary path."""
+    bench = Server(server.name, server.parent_name, server.is_alias, server.aliased_properties,
+                   **{prop: server.get(prop) for prop in Server.prop_list[1:]})
+    bench.profile = profile
+    bench.mount_path = tempfile.mkdtemp(prefix=f"mnt-bench-{server.name}-")
+    bench.append_mount_path = True
+    bench.unmount_command = server.get('unmount_command') or 'fusermount -u'
+    return bench
+
+def bench_profile(server, profile, size, files, timeout):
+    """
+    Mounts server with profile and measures it in a scratch directory under
+    remote_dir. The mount is remade between writing and reading, so reads and
+    metadata come from the server and not from the page cache.
+
+    Returns {metric: value}, or None if mounting failed.
+    """
+    bench = bench_server(server, profile)
+    scratch = os.path.join(bench.get('mount_path'), f".mnt-bench-{os.getpid()}")
+    block = os.urandom(bench_block)
+    results = {}
+
+    def remount(unmount):
+        if unmount:
+            run_command(bench.assemble_unmount_command(), timeout = timeout)
+        cmd = bench.assemble_mount_command()
+        print_styled(cmd, "italic")
+        return run_command(cmd, timeout = timeout) == 0
+
+    if not remount(False):
+        os.rmdir(bench.get('mount_path'))
+        return None
+    try:
+        os.mkdir(scratch)
+        start = time.monotonic()
+        with open(os.path.join(scratch, 'seq'), 'wb') as f:
+            for _ in range(size):
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        results['write'] = size / (time.monotonic() - start)
+        for i in range(files):
+            with open(os.path.join(scratch, f"small-{i}"), 'wb') as f:
+                f.write(block[:512])
+
+        if not remount(True):
+            return None
+        start = time.monotonic()
+        with open(os.path.join(scratch, 'small-0'), 'rb') as f:
+            f.read(1)
+        results['first_byte'] = (time.monotonic() - start) * 1000
+        start = time.monotonic()
+        for entry in os.scandir(scratch):
+            entry.stat()
+        results['metadata'] = (time.monotonic() - start) * 1000 / (files + 1)
+        start = time.monotonic()
+        with open(os.path.join(scratch, 'seq'), 'rb') as f:
+            while f.read(bench_block):
+                pass
+        results['read'] = size / (time.monotonic() - start)
+        return results
+    finally:
+        shutil.rmtree(scratch, ignore_errors = True)
+        run_command(bench.assemble_unmount_command(), timeout = timeout)
+        try:
+            os.rmdir(bench.get('mount_path'))
+        except OSError:
+            print_styled(f"Could not remove {bench.get('mount_path')}, it may still be mounted.", "yellow")
+
+def bench_winner(results):
+    """
+    The profile with the best geometric mean of its metrics, each relative to
+    the best value any profile reached for it.
+    """
+    higher_is_better = {'write': True, 'read': True, 'first_byte': False, 'metadata': False}
+    best = {}
+    for metric, higher in higher_is_better.items():
+        values = [metrics[metric] for metrics in results.values()]
+        best[metric] = max(values) if higher else min(values)
+
+    def score(metrics):
+        total = 1.0
+        for metric, higher in higher_is_better.items():
+            value = max(metrics[metric], 1e-9)
+            total *= value / best[metric] if higher else best[metric] / value
+        return total ** (1 / len(higher_is_better))
+    return max(results, key=lambda profile: score(results[profile]))
+
+def bench_command():
+    args = command_args()[2:]
+    options = {'--profiles': None, '--size': '64', '--files': '200', '--timeout': '30'}
+    save = '--save' in args
+    names = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--save':
+            continue
+        if arg in options:
+            if not args:
+                print_styled(f"Option {arg} needs a value.", "red")
+                sys.exit(1)
+            options[arg] = args.pop(0)
+        else:
+            names.append(arg)
+    if len(names) != 1:
+        print_styled('Usage: mnt bench <name> [--profiles <profile>,...] [--size MiB] [--files N] [--timeout S] [--save]', "red")
+        sys.exit(0)
+    try:
+        size, files, timeout = int(options['--size']), int(options['--files']), float(options['--timeout'])
+    except ValueError:
+        print_styled("Options --size, --files and --timeout need numeric values.", "red")
+        sys.exit(1)
+
+    server = get_server(None, names[0])
+    if server.get('command') != 'sshfs':
+        print_styled("mnt bench needs a server whose mount command is sshfs.", "red")
+        sys.exit(1)
+    profiles = get_profiles()
+    candidates = options['--profiles'].split(',') if options['--profiles'] else [None] + list(profiles)
+    for profile in candidates:
+        if profile is not None and profile not in profiles:
+            print_styled(f"Profile \"{profile}\" does not exist.", "red")
+            sys.exit(1)
+
+    if server.get('tunnel_port') is not None and server.setup_tunnel(timeout) != 0:
+        sys.exit(1)
+    results = {}
+    try:
+        for profile in candidates:
+            print_styled(f"--- {profile or 'no profile'} ---", "cyan")
+            metrics = bench_profile(server, profile, size, files, timeout)
+            if metrics is None:
+                print_styled("Mounting failed, skipped.", "red")
+            else:
+                results[profile] = metrics
+    finally:
+        if server.get('tunnel_port') is not None:
+            server.destroy_tunnel(timeout)
+    if not results:
+        sys.exit(1)
+
+    winner = bench_winner(results)
+    width = max([len(profile or 'none') for profile in results] + [7])
+    print_styled(f"\n{'Profile'.ljust(width)}  Write MiB/s  Read MiB/s  First byte  Stat/file", "bold")
+    for profile, metrics in results.items():
+        print_styled(f"{(profile or 'none').ljust(width)}  {metrics['write']:11.1f}  {metrics['read']:10.1f}  {metrics['first_byte']:8.1f}ms  {metrics['metadata']:7.2f}ms",
+                     "green" if profile == winner else None)
+    print_styled(f"Best: {winner or 'no profile'}", "bold")
+    if save:
+        server.set('profile', winner)
+        print_styled(f"Set profile of \"{server.name}\" to {winner or 'no profile'}", "green")
+    sys.exit(0)
 
 def help():
     print_styled('mnt.py', ["bold","italic"])
-    print("""
+    write_output("""
 mnt - Mount manager and remote execution tool
 
 Usage:
@@ -717,25 +2244,57 @@ Commands:
   General:
     help                            Show this help message
     list                            List all configured servers and aliases
+    recent [<count>]                List the most recently used servers
 
   Server Management:
     add                             Interactive server setup wizard
     tunnel                          Interactive SSH tunnel setup wizard
     alias                           Create a new server alias
-    delete <name>                   Delete a server or alias
+    group [<group> [<name> ...]]    Show groups, or set the members of a group
+    profile [<profile> [<option> ...|--delete]]
+                                    Show sshfs option profiles, or set one
+    bench <name> [--save]           Compare mount speed with each profile
+                                    (--profiles a,b --size MiB --files N)
+    delete <name>                   Delete a server, alias or group
     update <name> <property> <value> Update server properties:
         Properties: command, unmount_command, mount_path, append_mount_path,
-                   host, key_path, remote_dir, pre_command, shell
+                   host, key_path, remote_dir, pre_command, shell,
+                   control_persist, tunnel_timeout, profile, mode,
+                   include, exclude, warm_paths
 
   Mount Operations:
-    mount <name>                    Mount a server/alias
-    unmount <name|all>              Unmount a server/alias, or all of them
+    mount <name|group> [<name> ...] Mount a server/alias, or several in parallel
+    unmount <name|all> [<name> ...] Unmount servers/aliases, or all of them
+        Batch options: --jobs N (parallel workers), --timeout S (per server),
+                       --stream (live output prefixed with the server name)
     refresh <name>                  Update mounted timestamp
+    sync <name> [push|pull] [--watch]
+                                    Sync a mirror, or push its changes as
+                                    they happen (--interval S)
+    status [<name|group> ...]       Show what is mounted, unmounted or stale
+    health [<name|group> ...|--all] Check that mounts respond (--timeout S)
+    warm <name> [<path> ...]        Prefetch directory listings and attributes
+                                    (--depth N, --limit N, --jobs N)
+    watch [<name|group> ...]        Remount servers when they drop, until
+                                    stopped (--interval S, --jobs N)
 
   Remote Execution:
     ssh-exec [<name>] <command>     Execute command on remote server
                                     - Auto-detects from cwd or last mounted
+    ssh-exec <--all|--group <group>|<name>,<name>,...> -- <command>
+                                    Execute command on several servers in
+                                    parallel (batch options, default --jobs 16)
     ssh <name>                      Logs into an SSH shell
+    push <name> <local> [<remote>]  Copy a file to the server over SSH,
+    pull <name> <remote> [<local>]  or from it, bypassing the mount
+        Options: --streams N (parallel streams, default 4), --compress,
+                 --resume (continue an interrupted transfer)
+    masters [close [--force]] [<name> ...]
+                                    List or close shared SSH master connections
+    session <start|stop> <name>     Keep a remote shell open for ssh-exec
+    session list                    List running sessions
+    daemon <start|stop|status>      Keep mnt resident to answer cd, ssh-exec,
+                                    status, mount and unmount faster
 
   Navigation:
     cd <name>                       Output mount path for shell integration
@@ -745,7 +2304,10 @@ Examples:
     mnt add                         # Interactive server setup
     mnt alias                       # Create alias for existing server
     mnt web                         # Mount server 'web'
+    mnt group dev web db            # Group 'web' and 'db' as 'dev'
+    mnt dev                         # Mount every server in group 'dev'
     mnt ssh-exec web ls -l          # Execute command on 'web'
+    mnt ssh-exec --group dev -- df -h  # Execute command on group 'dev'
     mnt update web host user@newhost.com  # Update host property
 
 Server Properties:
@@ -758,38 +2320,134 @@ Server Properties:
     remote_dir:     Remote directory path
     pre_command:    Command to run before main command
     shell:          Remote shell (e.g. bash)
+    control_persist: How long an idle SSH master connection is kept open
+                    (default 10m, 'off' disables connection sharing)
+    tunnel_timeout: Seconds to wait for the tunnel port to accept connections
+                    (default 10)
+    mode:           mount (default) or mirror, a local copy kept with rsync
+    include, exclude: Comma-separated rsync patterns for mirror mode
+    warm_paths:     Comma-separated paths below mount_path to warm after
+                    mounting
+    profile:        sshfs option profile, e.g. lan-bulk or wan-interactive
 """)
     sys.exit(0)
 
 
+history = None
+
+def load_history():
+    """
+    Returns the mount history, most recent first, as a list of
+    {'name': ..., 'time': ...} entries. A config without a history file yet
+    gets one built from the mounted_time of every entry.
+    """
+    global history
+    if history is None:
+        try:
+            with open(history_path) as f:
+                history = json.load(f)['recent']
+        except (OSError, ValueError, KeyError):
+            history = []
+            for group in ('servers', 'aliases'):
+                for name, entry in config[group].items():
+                    if entry.get('mounted_time') is not None:
+                        history.append({'name': name, 'time': entry['mounted_time']})
+            history.sort(key=lambda entry: entry['time'], reverse=True)
+            del history[history_length:]
+    return history
+
+def record_mount(name, mounted_time):
+    """Moves name to the front of the mount history."""
+    global history
+    with config_lock, file_lock(history_path):
+        # Other mnt processes may have recorded mounts since this one read it
+        history = None
+        recent = [entry for entry in load_history() if entry['name'] != name]
+        recent.insert(0, {'name': name, 'time': mounted_time})
+        del recent[history_length:]
+        history[:] = recent
+        write_json_atomic(history_path, {'last': name, 'recent': recent})
+
 def last_mounted_server():
     """Returns name of most recently mounted server or alias, or None"""
-    last_name = None
-    last_time = None
+    for entry in load_history():
+        if entry['name'] in config['servers'] or entry['name'] in config['aliases']:
+            return entry['name']
+    return None
 
-    for server_name, server in config['servers'].items():
-        if server['mounted_time'] is not None:
-            if last_time is None or server['mounted_time'] > last_time:
-                last_name = server_name
-                last_time = server['mounted_time']
+def recent_servers():
+    try:
+        count = int(command_args()[2])
+    except IndexError:
+        count = 10
+    except ValueError:
+        print_styled('Usage: mnt recent [<count>]', "red")
+        sys.exit(0)
 
-    for alias in config['aliases'].values():
-        try: 
-            if alias['mounted_time'] is not None:
-                if last_time is None or alias['mounted_time'] > last_time:
-                    last_name = alias['name']
-                    last_time = alias['mounted_time']
-        except KeyError:
-            pass
+    shown = 0
+    for entry in load_history():
+        if shown >= count:
+            break
+        if entry['name'] not in config['servers'] and entry['name'] not in config['aliases']:
+            continue
+        mounted = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['time']))
+        write_output(f"{entry['name'].ljust(24)} {mounted}")
+        shown += 1
+    if shown == 0:
+        print_styled('Nothing mounted yet.', "italic")
+    sys.exit(0)
 
-    return last_name
+def normalize_path(path):
+    """
+    Absolute, normalized form of path. Only the parent directory is resolved
+    through symlinks, so a dead mount at path itself is never touched.
+    """
+    path = os.path.normpath(os.path.abspath(os.path.expanduser(path)))
+    parent, base = os.path.split(path)
+    return os.path.join(os.path.realpath(parent), base)
+
+mount_path_index = None
+
+def get_mount_path_index():
+    """Maps every normalized mount path to its server or alias, built once per run."""
+    global mount_path_index
+    index = mount_path_index
+    if index is None:
+        # Built aside and set whole, so other threads never see it half done
+        index = {}
+        mounts = read_mountinfo()
+        for name, server in resolve_servers().items():
+            mount_path = server.get('mount_path')
+            if mount_path is None:
+                continue
+            keys = [os.path.normpath(os.path.abspath(os.path.expanduser(mount_path))), normalize_path(mount_path)]
+            # A mount point is already a real path, and resolving one that is
+            # dead could hang, so only unmounted paths are resolved fully
+            if keys[1] not in mounts:
+                keys.append(os.path.realpath(keys[1]))
+            for key in keys:
+                index.setdefault(key, name)
+        mount_path_index = index
+    return index
 
 def get_server_from_mount_path(cwd):
-    for group in ('servers', 'aliases'):
-        for name, entry in config[group].items():
-            if entry['mount_path'] == cwd:
-                return name
-    return None
+    """
+    Finds the mount that contains cwd, by longest matching path prefix.
+    Symlinks in cwd are resolved first.
+
+    Returns (name, path of cwd relative to the mount path), or (None, None).
+    """
+    index = get_mount_path_index()
+    path = os.path.realpath(cwd)
+    relative = []
+    while True:
+        if path in index:
+            return index[path], '/'.join(reversed(relative)) or None
+        parent, base = os.path.split(path)
+        if parent == path:
+            return None, None
+        relative.append(base)
+        path = parent
 
 def ssh_shell():
     server = get_server(2)
@@ -802,6 +2460,8 @@ def ssh_shell():
         cmd = f"ssh -p {server.get('port')} -t {server.get_host()}"
     else:
         cmd = f"ssh -t {server.get_host()}"
+    for option in server.control_options():
+        cmd += f" {shlex.quote(option)}"
     if server.get('key_path') is not None:
         cmd += f" -i {os.path.expanduser(server.get('key_path'))}"
 
@@ -810,27 +2470,31 @@ def ssh_shell():
     cmd += f" {remote_cmd}"
 
     print_styled(cmd, "italic")
-    os.system(cmd)
+    get_executor().interactive(cmd)
     sys.exit(0)
 
 
-def ssh_exec():
+def ssh_exec(manager):
+    if len(command_args()) > 2 and is_fan_out_target(command_args()[2]):
+        ssh_exec_many(manager, command_args()[2:])
+
+    subdir = None
     try:
         # Try to get server name from args
-        server_name = sys.argv[2]
+        server_name = command_args()[2]
         if server_name in config['servers'] or server_name in config['aliases']:
             server = get_server(None, server_name)
         else:
             raise IndexError('Server not found')
-        command = " ".join(sys.argv[3:])  # If server found, command starts from argv[3]
+        command = " ".join(command_args()[3:])  # If server found, command starts from argv[3]
     except (KeyError, IndexError):
-        cwd = sys.argv[2]
+        cwd = local_path(command_args()[2])
         if not os.path.exists(cwd): # CWD does not exist, use last mounted
             server_name = last_mounted_server()
-            command = " ".join(sys.argv[2:])
+            command = " ".join(command_args()[2:])
         else:
-            server_name = get_server_from_mount_path(cwd)
-            command = " ".join(sys.argv[3:])
+            server_name, subdir = get_server_from_mount_path(cwd)
+            command = " ".join(command_args()[3:])
 
         if server_name is None:
             print_styled('Error: No server specified, no mount path at provided cwd, and no last-mounted server available', "red")
@@ -839,8 +2503,54 @@ def ssh_exec():
 
         server = get_server(None, server_name)
 
-    # Build SSH command components
-    ssh_parts = ['ssh', '-tt']  # Force pseudo-terminal allocation
+    run_ssh_exec(server, command, subdir)
+
+def run_ssh_exec(server, command, subdir = None):
+    server_name = server.name
+    # Check for required host
+    if server.get('host') is None:
+        print_styled(f'Error: Server "{server_name}" missing host configuration', "red")
+        write_output('Run: mnt enable-ssh-exec to configure')
+        sys.exit(1)
+
+    full_cmd = ssh_exec_command(server, command, subdir = subdir)
+
+    remote_dir = server.get('remote_dir')
+    if subdir is not None:
+        remote_dir = f"{remote_dir or '~'}/{subdir}"
+    if server.get('pre_command') is not None:
+        print_styled(f"[{server_name}:{remote_dir}] {server.get('pre_command')} && {command}", "italic")
+    else:
+        print_styled(f"[{server_name}:{remote_dir}] {command}", "italic")
+
+    # The remote side of a mirror must see local edits first
+    if server.get('mode') == 'mirror' and mirror_sync(server, 'push', quiet = True) != 0:
+        sys.exit(1)
+
+    # A running session already sits in remote_dir with pre_command applied
+    if subdir is not None:
+        status = session_exec(server.name, f"cd {shlex.quote(subdir)} && {command}")
+    else:
+        status = session_exec(server.name, command)
+    if status is not None:
+        sys.exit(status)
+
+    delegate = getattr(command_context, 'delegate', None)
+    if delegate is not None:
+        delegate(full_cmd)
+    if output_redirected():
+        # No terminal to give ssh, e.g. for Manager.run
+        sys.exit(run_command(ssh_exec_command(server, command, False, subdir)))
+    sys.exit(get_executor().interactive(full_cmd, forward_stderr))
+
+def ssh_exec_command(server, command, tty = True, subdir = None):
+    """
+    Builds the ssh argument list that runs command in the server's remote_dir,
+    or in subdir below it.
+    """
+    # Force pseudo-terminal allocation, unless output is captured
+    ssh_parts = ['ssh', '-tt' if tty else '-T']
+    ssh_parts.extend(server.control_options())
     if server.get('port') is not None:
         ssh_parts.extend(['-p', str(server.get('port'))])
 
@@ -848,12 +2558,6 @@ def ssh_exec():
     if server.get('key_path') is not None:
         ssh_parts.extend(['-i', os.path.expanduser(server.get('key_path'))])
 
-    # Check for required host
-    if server.get('host') is None:
-        print_styled(f'Error: Server "{server_name}" missing host configuration', "red")
-        print('Run: mnt enable-ssh-exec to configure')
-        sys.exit(1)
-
     # Add host
     ssh_parts.append(server.get_host())
 
@@ -864,6 +2568,8 @@ def ssh_exec():
     if server.get('remote_dir') is not None:
         # Use sh -c for better quoting behavior
         remote_cmd = remote_cmd + f"cd {shlex.quote(server.get('remote_dir'))} && "
+    if subdir is not None:
+        remote_cmd = remote_cmd + f"cd {shlex.quote(subdir)} && "
     if server.get('pre_command') is not None:
         remote_cmd = remote_cmd + server.get('pre_command') + " && "
 
@@ -873,40 +2579,719 @@ def ssh_exec():
         remote_cmd = remote_cmd + '" '
 
 
-    # Execute with proper shell handling
-    full_cmd = ssh_parts + [remote_cmd]
-    
-    if server.get('pre_command') is not None:
-        print_styled(f"[{server_name}:{server.get('remote_dir')}] {server.get('pre_command')} && {command}", "italic")
+    return ssh_parts + [remote_cmd]
+
+def is_fan_out_target(arg):
+    if arg in ('--all', '--group'):
+        return True
+    # Unknown names are reported later, rather than running the rest of the
+    # line on the last mounted server
+    return ',' in arg
+
+def ssh_exec_many(manager, args):
+    """Runs one command on several servers: --all, --group <group> or a,b,c."""
+    usage = 'Usage: mnt ssh-exec <--all|--group <group>|<name>,<name>,...> [--jobs N] [--timeout S] [--stream] -- <command>'
+    if '--' not in args:
+        print_styled(usage, "red")
+        sys.exit(1)
+    separator = args.index('--')
+    options, command = args[:separator], " ".join(args[separator + 1:])
+    if not command:
+        print_styled(usage, "red")
+        sys.exit(1)
+
+    target = options.pop(0)
+    if target == '--all':
+        names = list(config['servers']) + list(config['aliases'])
+    elif target == '--group':
+        if not options or options[0] not in config['groups']:
+            print_styled(usage, "red")
+            sys.exit(1)
+        names = expand_groups([options.pop(0)])
+    else:
+        names = expand_groups([name for name in target.split(',') if name])
+    extra, jobs, timeout, stream = parse_batch_args(options, jobs = 16)
+    if extra:
+        print_styled(usage, "red")
+        sys.exit(1)
+    check_server_names(names)
+    results = manager.ssh_exec_many(names, command, jobs, timeout, stream)
+    sys.exit(1 if any(not result.ok for result in results) else 0)
+
+def remote_exec(server, command, subdir = None, timeout = None, indent = False):
+    """
+    Runs command on server without a terminal, with its output passed to
+    write_output, so it can be collected. Returns the exit code.
+    """
+    if server.get('mode') == 'mirror' and mirror_sync(server, 'push', timeout, quiet = True) != 0:
+        return 1
+    return run_command(ssh_exec_command(server, command, False, subdir), indent, timeout)
+
+def forward_stderr(stream, limit = 65536):
+    """
+    Copies stream to stderr line by line as it arrives, dropping ssh's
+    "Connection to ... closed." messages. Lines longer than limit are passed
+    on in pieces, so memory use stays bounded.
+    """
+    while True:
+        line = stream.readline(limit)
+        if not line:
+            break
+        stripped = line.rstrip(b'\r\n')
+        if stripped.startswith(b'Connection to ') and stripped.endswith(b' closed.'):
+            continue
+        write_error(line)
+
+transfer_chunk_size = 64 * 1024 * 1024
+transfer_streams = 4
+transfer_block = 1024 * 1024
+
+def transfer_ssh_options(server, compress = False):
+    """ssh and its options for non-interactive transfers to server, without the host."""
+    ssh_parts = ['ssh', '-T', '-o', 'BatchMode=yes']
+    ssh_parts.extend(server.control_options())
+    if compress:
+        ssh_parts.append('-C')
+    if server.get('port') is not None:
+        ssh_parts.extend(['-p', str(server.get('port'))])
+    if server.get('key_path') is not None:
+        ssh_parts.extend(['-i', os.path.expanduser(server.get('key_path'))])
+    return ssh_parts
+
+def transfer_ssh(server, remote_cmd, compress = False):
+    """ssh arguments that run remote_cmd with a clean binary stdin and stdout."""
+    return transfer_ssh_options(server, compress) + [server.get_host(), remote_cmd]
+
+def remote_path(server, path):
+    """path on the server, relative paths taken from remote_dir."""
+    if path.startswith('/') or path.startswith('~') or server.get('remote_dir') is None:
+        return path
+    return f"{server.get('remote_dir').rstrip('/')}/{path}"
+
+def quote_remote(path):
+    # Leave a leading ~ for the remote shell to expand
+    if path == '~':
+        return path
+    if path.startswith('~/'):
+        return '~/' + shlex.quote(path[2:])
+    return shlex.quote(path)
+
+class TransferProgress:
+    """Counts transferred bytes across streams and prints the rate now and then."""
+
+    def __init__(self, total, done = 0):
+        self.total = total
+        self.done = done
+        self.resumed = done
+        self.start = time.monotonic()
+        self.printed = 0
+        self.lock = threading.Lock()
+
+    def add(self, count):
+        with self.lock:
+            self.done += count
+            now = time.monotonic()
+            if error_stream().isatty() and now - self.printed >= 0.5:
+                self.printed = now
+                write_error(f"\r{self.line()}   ")
+
+    def rate(self):
+        return (self.done - self.resumed) / max(time.monotonic() - self.start, 1e-6) / 1e6
+
+    def line(self):
+        percent = 100 * self.done / self.total if self.total else 100
+        return f"{self.done / 1e6:.1f}/{self.total / 1e6:.1f} MB ({percent:.0f}%) {self.rate():.1f} MB/s"
+
+    def finish(self):
+        if error_stream().isatty():
+            write_error('\r')
+        print_styled(f"{self.line()} in {time.monotonic() - self.start:.1f}s", "green" if self.done == self.total else "red")
+
+def push_chunk(server, local, remote, offset, length, compress, progress):
+    """Writes one byte range of local into the same range of remote."""
+    remote_cmd = f"dd of={quote_remote(remote)} bs={transfer_block} seek={offset} oflag=seek_bytes conv=notrunc status=none"
+    process = get_executor().spawn(transfer_ssh(server, remote_cmd, compress), stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        with open(local, 'rb') as f:
+            f.seek(offset)
+            left = length
+            while left > 0:
+                data = f.read(min(transfer_block, left))
+                if not data:
+                    break
+                process.stdin.write(data)
+                left -= len(data)
+                progress.add(len(data))
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    error = process.stderr.read()
+    status = process.wait()
+    if status != 0:
+        print_styled(f"Chunk at {offset} failed: {error.decode(errors='replace').strip()}", "red")
+    return status
+
+def pull_chunk(server, remote, local, offset, length, compress, progress):
+    """Reads one byte range of remote into the same range of local."""
+    remote_cmd = f"dd if={quote_remote(remote)} bs={transfer_block} skip={offset} count={length} iflag=skip_bytes,count_bytes status=none"
+    process = get_executor().spawn(transfer_ssh(server, remote_cmd, compress), stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    fd = os.open(local, os.O_WRONLY)
+    received = 0
+    try:
+        while True:
+            data = process.stdout.read(transfer_block)
+            if not data:
+                break
+            os.pwrite(fd, data, offset + received)
+            received += len(data)
+            progress.add(len(data))
+    finally:
+        os.close(fd)
+    error = process.stderr.read()
+    status = process.wait()
+    if status == 0 and received != length:
+        error = f"got {received} of {length} bytes".encode()
+        status = 1
+    if status != 0:
+        print_styled(f"Chunk at {offset} failed: {error.decode(errors='replace').strip()}", "red")
+    return status
+
+def remote_size(server, path, compress = False):
+    result = get_executor().run(transfer_ssh(server, f"wc -c < {quote_remote(path)}", compress))
+    if result.returncode != 0 or not result.stdout.strip().isdigit():
+        print_styled(f"Cannot read {path} on {server.name}: {result.stderr.strip()}", "red")
+        sys.exit(1)
+    return int(result.stdout.strip())
+
+def transfer(server, direction, local, remote, streams, compress, resume):
+    """
+    Copies one file between here and the server over parallel ssh streams,
+    one byte range per stream. Finished ranges are kept in the state store,
+    so an interrupted transfer can resume with the rest.
+    """
+    if direction == 'push':
+        size = os.path.getsize(local)
     else:
-        print_styled(f"[{server_name}:{server.get('remote_dir')}] {command}", "italic")
-    p = subprocess.Popen(full_cmd, stderr=subprocess.PIPE)
-    _, stderr = p.communicate()
-
-    # Filter out any line that starts with "Connection to" and ends with "closed."
-    filtered_stderr = b'\n'.join(
-        line for line in stderr.splitlines()
-        if not (
-            line.startswith(b'Connection to ')
-            and line.endswith(b' closed.')
+        size = remote_size(server, remote, compress)
+
+    chunks = [(offset, min(transfer_chunk_size, size - offset)) for offset in range(0, size, transfer_chunk_size)]
+    key = f"transfer:{server.name}:{direction}:{remote}:{os.path.abspath(local)}"
+    done = []
+    if resume and get_state(key, 'size') == size and get_state(key, 'chunk_size') == transfer_chunk_size:
+        done = get_state(key, 'done') or []
+    set_state(key, size = size, chunk_size = transfer_chunk_size, done = done)
+    todo = [chunk for chunk in chunks if chunk[0] not in done]
+    if done:
+        print_styled(f"Resuming: {len(done)} of {len(chunks)} chunk(s) already transferred.", "blue")
+
+    # Size the destination first, so ranges can be written in any order
+    if direction == 'push':
+        result = get_executor().run(transfer_ssh(server, f"touch {quote_remote(remote)} && truncate -s {size} {quote_remote(remote)}"))
+        if result.returncode != 0:
+            print_styled(f"Cannot create {remote} on {server.name}: {result.stderr.strip()}", "red")
+            return result.returncode
+    else:
+        with open(local, 'r+b' if os.path.exists(local) else 'wb') as f:
+            f.truncate(size)
+
+    progress = TransferProgress(size, sum(length for offset, length in chunks if offset in done))
+    action = push_chunk if direction == 'push' else pull_chunk
+    source, target = (local, remote) if direction == 'push' else (remote, local)
+    status = 0
+    with futures.ThreadPoolExecutor(max_workers=streams) as pool:
+        action = in_context(action)
+        running = {pool.submit(action, server, source, target, offset, length, compress, progress): offset for offset, length in todo}
+        for future in futures.as_completed(running):
+            if future.result() == 0:
+                with config_lock:
+                    done.append(running[future])
+                    set_state(key, done = done)
+            else:
+                status = 1
+    progress.finish()
+    if status != 0:
+        print_styled("Transfer incomplete. Run again with --resume to copy the rest.", "red")
+    else:
+        set_state(key, size = None, chunk_size = None, done = None)
+    return status
+
+def transfer_command(direction):
+    usage = f"Usage: mnt {direction} <name> {'<local> [<remote>]' if direction == 'push' else '<remote> [<local>]'} [--streams N] [--compress] [--resume]"
+    args = command_args()[2:]
+    streams = transfer_streams
+    compress = '--compress' in args
+    resume = '--resume' in args
+    args = [arg for arg in args if arg not in ('--compress', '--resume')]
+    if '--streams' in args:
+        i = args.index('--streams')
+        try:
+            streams = max(int(args[i + 1]), 1)
+        except (IndexError, ValueError):
+            print_styled("Option --streams needs a numeric value.", "red")
+            sys.exit(1)
+        del args[i:i + 2]
+    if len(args) not in (2, 3):
+        print_styled(usage, "red")
+        sys.exit(0)
+
+    server = get_server(None, args[0])
+    if direction == 'push':
+        local = local_path(args[1])
+        remote = args[2] if len(args) == 3 else os.path.basename(local.rstrip('/'))
+        if not os.path.isfile(local):
+            print_styled(f"{local} is not a file.", "red")
+            sys.exit(1)
+    else:
+        remote = args[1]
+        local = local_path(args[2] if len(args) == 3 else os.path.basename(remote.rstrip('/')))
+        if os.path.isdir(local):
+            local = os.path.join(local, os.path.basename(remote.rstrip('/')))
+    remote = remote_path(server, remote)
+
+    tunnel = server.get('tunnel_port') is not None and not port_open(server.get('port'))
+    if tunnel and server.setup_tunnel() != 0:
+        sys.exit(1)
+    try:
+        arrow = '->' if direction == 'push' else '<-'
+        print_styled(f"{local} {arrow} {server.name}:{remote}", "italic")
+        status = transfer(server, direction, local, remote, streams, compress, resume)
+    finally:
+        if tunnel:
+            server.destroy_tunnel()
+    sys.exit(status)
+
+rsync_stats = {
+    'files': r'Number of (?:regular )?files transferred: ([\d,]+)',
+    'total': r'Total file size: ([\d,]+)',
+    'changed': r'Total transferred file size: ([\d,]+)',
+    'matched': r'Matched data: ([\d,]+)',
+    'sent': r'Total bytes sent: ([\d,]+)',
+    'received': r'Total bytes received: ([\d,]+)',
+}
+mirror_watch_interval = 1.0
+
+def format_size(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1000 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1000
+
+def parse_rsync_stats(output):
+    """Reads the numbers of rsync --stats into a dict, 0 for those missing."""
+    stats = {}
+    for key, pattern in rsync_stats.items():
+        match = re.search(pattern, output)
+        stats[key] = int(match.group(1).replace(',', '')) if match else 0
+    return stats
+
+def mirror_sync(server, direction, timeout = None, quiet = False):
+    """
+    Syncs remote_dir and mount_path of a mirror server with rsync, pulling
+    to or pushing from the local copy. Files that are newer on the receiving
+    side are left alone, and nothing is deleted.
+    """
+    local = os.path.join(os.path.expanduser(server.get('mount_path')), '')
+    remote = f"{server.get_host()}:{os.path.join(server.get('remote_dir') or '', '')}"
+    os.makedirs(local, exist_ok=True)
+    cmd = ['rsync', '-rlpt', '--update', '--partial', '--stats',
+           '-e', ' '.join(shlex.quote(part) for part in transfer_ssh_options(server))]
+    cmd += [f"--include={pattern}" for pattern in server.get('include') or []]
+    cmd += [f"--exclude={pattern}" for pattern in server.get('exclude') or []]
+    cmd += [remote, local] if direction == 'pull' else [local, remote]
+    if not quiet:
+        print_styled(f"rsync {direction}: {remote if direction == 'pull' else local} -> {local if direction == 'pull' else remote}", "italic")
+    try:
+        result = get_executor().run(cmd, timeout)
+    except subprocess.TimeoutExpired:
+        print_styled(f"rsync {direction} timed out.", "red")
+        return 124
+    except FileNotFoundError:
+        print_styled("Mirror mode needs rsync, which was not found.", "red")
+        return 127
+    if result.returncode != 0:
+        write_output(result.stderr.rstrip())
+        print_styled(f"rsync {direction} failed with exit code {result.returncode}.", "red")
+        return result.returncode
+
+    stats = parse_rsync_stats(result.stdout)
+    if not quiet or stats['files']:
+        print_styled(f"{direction}: {stats['files']} file(s) updated, {format_size(stats['changed'])} of {format_size(stats['total'])} changed, "
+                     f"{format_size(stats['total'] - stats['changed'])} skipped; {format_size(stats['matched'])} reused by delta transfer, "
+                     f"{format_size(stats['sent'] + stats['received'])} on the wire", "green")
+    set_state(server.name, synced_time = int(time.time()))
+    return 0
+
+def tree_signature(path, exclude):
+    """Size and mtime of every file below path, skipping excluded names."""
+    signature = {}
+    pending = [path]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if any(fnmatch.fnmatch(entry.name, pattern) for pattern in exclude):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                else:
+                    stat = entry.stat(follow_symlinks=False)
+                    signature[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                pass
+    return signature
+
+def sync_command():
+    usage = 'Usage: mnt sync <name> [push|pull] [--watch [--interval S]]'
+    args = command_args()[2:]
+    watch = '--watch' in args
+    args = [arg for arg in args if arg != '--watch']
+    interval = mirror_watch_interval
+    if '--interval' in args:
+        i = args.index('--interval')
+        try:
+            interval = float(args[i + 1])
+        except (IndexError, ValueError):
+            print_styled("Option --interval needs a numeric value.", "red")
+            sys.exit(1)
+        del args[i:i + 2]
+    if not args or len(args) > 2 or (len(args) == 2 and args[1] not in ('push', 'pull')):
+        print_styled(usage, "red")
+        sys.exit(0)
+
+    server = get_server(None, args[0])
+    if server.get('mode') != 'mirror':
+        print_styled(f"\"{server.name}\" is not a mirror. Set it with: mnt update {server.name} mode mirror", "red")
+        sys.exit(1)
+    directions = [args[1]] if len(args) == 2 else ['push', 'pull']
+    status = 0
+    for direction in directions:
+        status = status or mirror_sync(server, direction)
+    if not watch:
+        sys.exit(status)
+
+    # No file change notification in the standard library, so poll
+    local = os.path.expanduser(server.get('mount_path'))
+    exclude = server.get('exclude') or []
+    print_styled(f"Watching {local} every {interval:g}s, pushing changes. Ctrl-C stops.", "bold")
+    signature = tree_signature(local, exclude)
+    try:
+        while True:
+            time.sleep(interval)
+            current = tree_signature(local, exclude)
+            if current != signature:
+                signature = current
+                mirror_sync(server, 'push', quiet = True)
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+def session_socket_path(server_name):
+    return os.path.join(sessions_folder, f"{server_name}.sock")
+
+def connect_session(server_name):
+    """Returns a socket connected to the server's session, or None."""
+    path = session_socket_path(server_name)
+    if not os.path.exists(path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+    return client
+
+def send_frame(connection, kind, data):
+    connection.sendall(struct.pack('!cI', kind, len(data)) + data)
+
+def receive_exactly(connection, size):
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise EOFError('Session closed the connection.')
+        data += chunk
+    return data
+
+def receive_frame(connection):
+    kind, size = struct.unpack('!cI', receive_exactly(connection, 5))
+    return kind, receive_exactly(connection, size)
+
+def session_exec(server_name, command):
+    """
+    Runs command in the server's session, if one is running.
+
+    Returns the command's exit code, or None when there is no session.
+    """
+    client = connect_session(server_name)
+    if client is None:
+        return None
+    with client:
+        client.sendall(json.dumps({'command': command}).encode() + b'\n')
+        try:
+            while True:
+                kind, data = receive_frame(client)
+                if kind == b'o':
+                    write_stream(output_stream(), data)
+                elif kind == b'e':
+                    write_error(data)
+                elif kind == b'x':
+                    return int(data)
+        except EOFError as e:
+            print_styled(f"Error: {e}", "red")
+            return 1
+
+class RemoteShell:
+    """
+    A long-lived shell on the server. Commands are written to its stdin, and
+    a marker printed after each one tells where its stdout and stderr end.
+    It waits on the file descriptors of its ssh process's pipes, so it needs
+    a real process and does not run under a FakeExecutor.
+    """
+
+    def __init__(self, server):
+        cmd = ['ssh', '-T'] + server.control_options()
+        if server.get('key_path') is not None:
+            cmd.extend(['-i', os.path.expanduser(server.get('key_path'))])
+        cmd.extend(server.ssh_target())
+        if server.get('shell') is not None:
+            cmd.extend([server.get('shell'), '-i'])
+        self.process = get_executor().spawn(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def run(self, command, send):
+        """Runs command, passing output to send(kind, data). Returns its exit code."""
+        marker = os.urandom(8).hex().encode()
+        # The subshell keeps cd and variables from leaking into later commands
+        script = (
+            f"( eval {shlex.quote(command)} ) < /dev/null; __mnt_status=$?; "
+            f"printf '\\n%s %d\\n' {marker.decode()} $__mnt_status; "
+            f"printf '\\n%s\\n' {marker.decode()} >&2\n"
         )
-    )
+        self.process.stdin.write(script.encode())
+        self.process.stdin.flush()
+        return self.relay(b'\n' + marker, send)
+
+    def relay(self, needle, send):
+        streams = {
+            self.process.stdout.fileno(): {'kind': b'o', 'buffer': b'', 'found': False},
+            self.process.stderr.fileno(): {'kind': b'e', 'buffer': b'', 'found': False},
+        }
+        status = 1
+        selector = selectors.DefaultSelector()
+        for fd in streams:
+            selector.register(fd, selectors.EVENT_READ)
+        with selector:
+            while selector.get_map():
+                for key, _ in selector.select():
+                    stream = streams[key.fd]
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        raise EOFError('Remote shell exited.')
+                    stream['buffer'] += chunk
+                    if not stream['found']:
+                        index = stream['buffer'].find(needle)
+                        if index == -1:
+                            # Hold back anything that could be the start of the marker
+                            cut = len(stream['buffer']) - len(needle) + 1
+                            if cut > 0:
+                                send(stream['kind'], stream['buffer'][:cut])
+                                stream['buffer'] = stream['buffer'][cut:]
+                            continue
+                        if index > 0:
+                            send(stream['kind'], stream['buffer'][:index])
+                        stream['buffer'] = stream['buffer'][index + len(needle):]
+                        stream['found'] = True
+                    if b'\n' in stream['buffer']:
+                        if stream['kind'] == b'o':
+                            status = int(stream['buffer'].split(b'\n', 1)[0])
+                        selector.unregister(key.fd)
+        return status
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.terminate()
+        self.process.wait()
+
+def serve_session(server):
+    """Runs in the background, relaying commands from local clients to one shell."""
+    shell = RemoteShell(server)
+    setup = "set +o emacs +o vi 2>/dev/null; PS1=''; PS2=''; unset PROMPT_COMMAND; set +H 2>/dev/null; true"
+    if server.get('remote_dir') is not None:
+        setup += f" && cd {shlex.quote(server.get('remote_dir'))}"
+    if server.get('pre_command') is not None:
+        setup += f" && {server.get('pre_command')}"
+    # Output of the setup includes rc file noise, so it is not relayed
+    shell.process.stdin.write(f"{setup}; __mnt_setup=$?\n".encode())
+    try:
+        if shell.run('exit $__mnt_setup', lambda kind, data: None) != 0:
+            raise EOFError('Changing to remote_dir or running pre_command failed.')
+    except EOFError as e:
+        write_output(e)
+        shell.close()
+        return 1
+
+    path = session_socket_path(server.name)
+    if os.path.exists(path):
+        os.remove(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+    try:
+        while True:
+            connection, _ = listener.accept()
+            with connection:
+                try:
+                    request = json.loads(connection.makefile('rb').readline())
+                except ValueError:
+                    continue
+                if request.get('stop'):
+                    break
+
+                # Keep draining the shell even if the client went away
+                def send(kind, data):
+                    try:
+                        send_frame(connection, kind, data)
+                    except OSError:
+                        pass
+                try:
+                    status = shell.run(request['command'], send)
+                except EOFError:
+                    send(b'x', b'1')
+                    break
+                send(b'x', str(status).encode())
+    finally:
+        listener.close()
+        os.remove(path)
+        shell.close()
+    return 0
+
+def start_session(server):
+    if connect_session(server.name) is not None:
+        print_styled(f"Session for \"{server.name}\" is already running.", "yellow")
+        return 0
+    log_path = os.path.join(sessions_folder, f"{server.name}.log")
+    with open(log_path, 'w') as log:
+        process = get_executor().spawn(
+            [sys.executable, os.path.abspath(__file__), 'session', 'serve', server.name],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True
+        )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if connect_session(server.name) is not None:
+            print_styled(f"Started session for \"{server.name}\".", "green")
+            return 0
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    process.kill()
+    print_styled(f"Session for \"{server.name}\" could not be started. See {log_path}", "red")
+    return 1
+
+def stop_session(server_name):
+    client = connect_session(server_name)
+    if client is None:
+        print_styled(f"No session running for \"{server_name}\".", "yellow")
+        return
+    with client:
+        client.sendall(json.dumps({'stop': True}).encode() + b'\n')
+    print_styled(f"Stopped session for \"{server_name}\".", "green")
+
+def session():
+    usage = 'Usage: mnt session <start|stop> <server_name>, or mnt session list'
+    try:
+        action = command_args()[2]
+    except IndexError:
+        print_styled(usage, "red")
+        sys.exit(0)
+
+    if action == 'list':
+        for file_name in sorted(os.listdir(sessions_folder)):
+            if file_name.endswith('.sock'):
+                server_name = file_name[:-len('.sock')]
+                client = connect_session(server_name)
+                if client is not None:
+                    client.close()
+                    write_output(f"{server_name}: running")
+                else:
+                    write_output(f"{server_name}: stale")
+        sys.exit(0)
 
-    if filtered_stderr:
-        sys.stderr.buffer.write(filtered_stderr)
-        sys.stderr.buffer.write(b'\n')
-    sys.exit(p.returncode)
+    if action not in ('start', 'stop', 'serve'):
+        print_styled(usage, "red")
+        sys.exit(0)
+    server = get_server(3)
+    if action == 'start':
+        sys.exit(start_session(server))
+    elif action == 'stop':
+        stop_session(server.name)
+    else:
+        sys.exit(serve_session(server))
+    sys.exit(0)
+
+def ssh_masters():
+    """Lists the shared SSH master connections, or closes them with 'close'."""
+    args = command_args()[2:]
+    close = bool(args) and args[0] == 'close'
+    force = '--force' in args
+    if close:
+        args = [arg for arg in args[1:] if arg != '--force']
+    if not args or args == ['all']:
+        names = list(config['servers']) + list(config['aliases'])
+    else:
+        check_server_names(args)
+        names = args
+
+    # Aliases normally share their parent's host, and so its master
+    targets = {}
+    for name in names:
+        server = get_server(None, name)
+        if server.get('host') is None or not server.control_options():
+            continue
+        targets.setdefault(tuple(server.ssh_target()), (name, server))
+
+    if close and not force:
+        # sshfs runs over the master, so closing it would break the mount
+        snapshot = MountSnapshot()
+        for server in resolve_servers().values():
+            target = tuple(server.ssh_target()) if server.get('host') is not None else None
+            if target in targets and server.get('command') == 'sshfs' and snapshot.mount_of(server) is not None:
+                print_styled(f"Not closing master for \"{targets.pop(target)[0]}\": \"{server.name}\" is mounted over it. Use --force to close it anyway.", "yellow")
+
+    def control(item):
+        name, server = item
+        result = get_executor().run(['ssh', '-O', 'exit' if close else 'check'] + server.control_options() + server.ssh_target())
+        return name, server, result.returncode, result.stderr.strip()
+
+    found = 0
+    with futures.ThreadPoolExecutor(max_workers=8) as pool:
+        for name, server, returncode, message in pool.map(in_context(control), targets.values()):
+            if returncode != 0:
+                continue
+            found += 1
+            if close:
+                print_styled(f"Closed master for \"{name}\" ({server.get_host()})", "green")
+            else:
+                write_output(f"{name}: {server.get_host()} {message}")
+
+    if found == 0:
+        print_styled('No master connections running.', "italic")
+    sys.exit(0)
 
 def cd_mount_path():
     try:
         # Try to get server name from args
-        server_name = sys.argv[2]
+        server_name = command_args()[2]
     except (KeyError, IndexError):
         # No server specified - use last mounted
         server_name = last_mounted_server()
         if server_name is None:
             print_styled('Error: No server specified and no last-mounted server available', "red")
-            print('Usage: mnt cd [<server_name>]')
+            write_output('Usage: mnt cd [<server_name>]')
             sys.exit(1)
 
     server = get_server(None, server_name)
@@ -915,19 +3300,21 @@ def cd_mount_path():
         print_styled(f"Server \"{server_name}\" does not have a mount path.", "red")
         sys.exit(1)
 
-    print(server.get('mount_path'))
+    write_output(server.get('mount_path'))
     sys.exit(0)
 
 def refresh_server():
     server = get_server(2)
-    server.set("mounted_time", int(time.time()))
-    print_styled(f"Refreshed mount time of \"{server_name}\".", "green")
+    server.mounted_time = int(time.time())
+    set_state(server.name, mounted_time = server.mounted_time)
+    record_mount(server.name, server.mounted_time)
+    print_styled(f"Refreshed mount time of \"{server.name}\".", "green")
 
     sys.exit(0)
 
 
 def enable_cd():
-    print("""If the cd-command just outputs the mount path, you must install the cd-help script. To do so, add this to your .bashrc/.zshrc:
+    write_output("""If the cd-command just outputs the mount path, you must install the cd-help script. To do so, add this to your .bashrc/.zshrc:
 mnt() {
   if [[ "$1" == "cd" ]]; then
     cd "$(command mnt "$@")"
@@ -948,37 +3335,520 @@ end
 
 """)
 
-if __name__ == '__main__':
-    config = setup_config()
+def reload_config(signature = None):
+    """
+    Loads config.json, again only if it changed since signature, dropping
+    what was resolved from the old one, and rereads state written by other
+    processes. Returns the signature of the config now loaded.
+    """
+    global config, resolved_servers, mount_path_index, history
+    # Swapped under the lock, so threads resolving servers or saving the
+    # config never see the new config with what was resolved from the old
+    with config_lock:
+        if signature is None or config_signature() != signature:
+            config, signature = setup_config()
+            update_config_cache(signature)
+            resolved_servers = None
+            mount_path_index = None
+    refresh_state()
+    history = None
+    return signature
+
+def run_cli(argv, stdout, stderr, cwd = None, manager = None):
+    """
+    Runs a mnt command line on this thread with manager, or a new Manager,
+    and returns its exit code. Its output goes to stdout and stderr, and
+    relative paths are taken from cwd. sys.argv, sys.stdout and the working
+    directory are left alone, so other threads are not affected.
+    """
+    saved_output, saved_command = dict(vars(output_context)), dict(vars(command_context))
+    output_context.lines = output_context.prefix = None
+    output_context.stdout, output_context.stderr = stdout, stderr
+    output_context.live = True
+    command_context.argv = ['mnt'] + list(argv)
+    command_context.cwd = cwd
+    try:
+        if manager is None:
+            manager = Manager()
+        else:
+            manager.reload()
+        dispatch(manager)
+        return 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        print_styled(f"Error: {e}", "red")
+        return 1
+    finally:
+        vars(output_context).clear()
+        vars(output_context).update(saved_output)
+        vars(command_context).clear()
+        vars(command_context).update(saved_command)
+
+def capture(name, action, check = False, executor = None):
+    """
+    Runs action() with everything it prints collected without colors, and
+    commands run through executor if given. Returns a Result with the exit
+    code it returned. With check set, raises CommandFailed or CommandTimeout
+    if that is not 0.
+    """
+    saved_output, saved_command = dict(vars(output_context)), dict(vars(command_context))
+    output_context.lines, output_context.prefix, output_context.plain = [], None, True
+    output_context.stdout = output_context.stderr = None
+    output_context.live = False
+    if executor is not None:
+        command_context.executor = executor
+    started = time.time()
+    start = time.monotonic()
+    try:
+        code = action()
+    finally:
+        lines = output_context.lines
+        vars(output_context).clear()
+        vars(output_context).update(saved_output)
+        vars(command_context).clear()
+        vars(command_context).update(saved_command)
+    return checked(Result(name, code, ''.join(lines), started, time.monotonic() - start), check)
+
+def checked(result, check):
+    """Returns result, or with check set raises CommandTimeout or CommandFailed if it failed."""
+    if check and result.code == 124:
+        raise CommandTimeout(result)
+    if check and result.code != 0:
+        raise CommandFailed(result)
+    return result
+
+class Manager:
+    """
+    Runs mnt's operations from Python without sys.argv or sys.exit; the
+    command line is a thin layer over one. It loads the config and state
+    once and picks up changes other processes make to them before each call.
+    Operations return a Result and raise MntError subclasses.
+
+        manager = mnt.Manager()
+        result = manager.ssh_exec('web', 'uptime', timeout = 10)
+        print(result.code, result.output)
+
+    Their output is collected into Result.output, except while a command line
+    runs, when it is written as it happens and Result.output is left empty.
+
+    Operations can run on several threads at once. With executor, e.g. a
+    FakeExecutor, the commands this manager's operations run go through it.
+    """
 
+    def __init__(self, executor = None):
+        self.executor = executor
+        self.signature = reload_config()
+
+    def reload(self):
+        self.signature = reload_config(self.signature)
+
+    @property
+    def config(self):
+        return config
+
+    def server(self, name):
+        """The resolved Server for a server or alias. Raises ServerNotFound."""
+        self.reload()
+        return find_server(name)
+
+    def servers(self):
+        """Every server and alias by name."""
+        self.reload()
+        return dict(resolve_servers())
+
+    def status(self, names = None):
+        """Returns {name: server_status(...)} for servers and groups in names, or for every server and alias."""
+        self.reload()
+        names = expand_groups(names) if names else list(resolve_servers())
+        require_servers(names)
+        snapshot = MountSnapshot()
+        return {name: server_status(find_server(name), snapshot) for name in names}
+
+    def mount(self, name, timeout = None, check = False):
+        server = self.server(name)
+        return self.call(name, lambda: server.mount(timeout = timeout), check)
+
+    def unmount(self, name, timeout = None, check = False):
+        server = self.server(name)
+        return self.call(name, lambda: server.unmount(timeout = timeout), check)
+
+    def ssh_exec(self, name, command, subdir = None, timeout = None, check = False):
+        """Runs command in the server's remote_dir, or subdir below it, without a terminal."""
+        server = self.server(name)
+        if server.get('host') is None:
+            raise InvalidValue(f"Server \"{name}\" missing host configuration")
+        return self.call(name, lambda: remote_exec(server, command, subdir, timeout), check)
+
+    def mount_many(self, names, jobs = 8, timeout = None, stream = False):
+        """
+        Mounts servers and groups in parallel, skipping those already
+        mounted. Returns a Result per server mounted.
+        """
+        def action(names, summary):
+            snapshot = MountSnapshot()
+            mounted = [name for name in names if snapshot.status(find_server(name)) == 'mounted']
+            if mounted:
+                print_styled(f"Skipping {len(mounted)} already mounted: {', '.join(mounted)}", "italic")
+                names = [name for name in names if name not in mounted]
+            if not names:
+                return []
+            return mount_batch(names, jobs, timeout, stream, snapshot, summary)
+        return self.batch(names, action)
+
+    def unmount_many(self, names, jobs = 8, timeout = 30, stream = False):
+        """
+        Unmounts servers and groups in parallel, skipping those not mounted.
+        Returns a Result per server unmounted.
+        """
+        def action(names, summary):
+            snapshot = MountSnapshot()
+            idle = [name for name in names if snapshot.status(find_server(name)) == 'unmounted']
+            if idle:
+                print_styled(f"Skipping {len(idle)} not mounted: {', '.join(idle)}", "italic")
+                names = [name for name in names if name not in idle]
+            if not names:
+                return []
+            return run_batch(names, lambda server: server.unmount(not stream, timeout, snapshot), jobs, summary, stream)
+        return self.batch(names, action)
+
+    def ssh_exec_many(self, names, command, jobs = 16, timeout = None, stream = False):
+        """
+        Runs command on servers and groups in parallel, skipping servers
+        without a host. Returns a Result per server it ran on.
+        """
+        def action(names, summary):
+            names = [name for name in names if find_server(name).get('host') is not None]
+            print_styled(f"Running on {len(names)} server(s): {command}", "italic")
+            return run_batch(names, lambda server: remote_exec(server, command, timeout = timeout, indent = not stream), jobs, summary, stream)
+        return self.batch(names, action)
+
+    def batch(self, names, action):
+        """
+        Returns the Results of action(names, summary), with groups in names
+        expanded. Raises ServerNotFound before anything runs if a name is
+        unknown. Only the command line has a summary printed.
+        """
+        self.reload()
+        names = expand_groups(names)
+        require_servers(names)
+        summary = getattr(output_context, 'live', False)
+        results = []
+        self.call('batch', lambda: results.extend(action(names, summary)) or 0)
+        return results
+
+    def update(self, name, prop, value):
+        """
+        Sets prop of a server or alias to value, already of its stored type,
+        and saves it. Aliases keep the property as their own, over the
+        parent's.
+        """
+        if prop not in updatable_props:
+            raise InvalidValue(f"Invalid property. Must be one of: {', '.join(updatable_props)}")
+        server = self.server(name)
+        if prop == "mode" and value not in ('mount', 'mirror'):
+            raise InvalidValue("Mode must be mount or mirror.")
+        elif prop == "profile" and value not in get_profiles():
+            raise InvalidValue(f"Profile \"{value}\" does not exist. Must be one of: {', '.join(get_profiles())}")
+
+        renamed = {'mount': 'command', 'unmount': 'unmount_command'}
+        server.set(renamed.get(prop, prop), value)
+
+    def call(self, name, action, check = False):
+        """
+        Runs action() as the operation called name, with commands going
+        through this manager's executor, and returns its Result.
+        """
+        if not getattr(output_context, 'live', False):
+            return capture(name, action, check, self.executor)
+        saved = getattr(command_context, 'executor', None)
+        if self.executor is not None:
+            command_context.executor = self.executor
+        started = time.time()
+        start = time.monotonic()
+        try:
+            code = action()
+        finally:
+            command_context.executor = saved
+        return checked(Result(name, code, '', started, time.monotonic() - start), check)
+
+    def run(self, *argv, cwd = None, check = False):
+        """
+        Runs any mnt command line, e.g. run('list') or run('group'), on this
+        thread, with relative paths taken from cwd. Unknown commands give
+        code 1. Commands that ask for confirmation read it from stdin.
+        """
+        def action():
+            output = io.StringIO()
+            code = run_cli(argv, output, output, cwd, self)
+            write_output(output.getvalue(), end='')
+            return code
+        return capture(' '.join(argv), action, check, self.executor)
+
+daemon_socket_path = os.path.join(config_folder, 'daemon.sock')
+daemon_log_path = os.path.join(config_folder, 'daemon.log')
+daemon_commands = ('cd', 'ssh-exec', 'status', 'mount', 'unmount')
+# Requests run one at a time, so their effects on state happen in order
+daemon_lock = threading.Lock()
+
+class FrameWriter:
+    """Stands in for stdout or stderr, sending what is written as frames."""
+
+    # Batch workers write from several threads, and frames must not interleave
+    lock = threading.Lock()
+
+    def __init__(self, connection, kind):
+        self.connection = connection
+        self.kind = kind
+        self.buffer = self
+
+    def write(self, data):
+        try:
+            with self.lock:
+                send_frame(self.connection, self.kind, data.encode() if isinstance(data, str) else data)
+        except OSError:
+            # The client went away, finish the command anyway
+            pass
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+def daemon_client():
+    """
+    Runs the command in a running daemon, if it is one the daemon serves.
+    Returns only if there is no daemon to talk to. cd and ssh-exec only get
+    here if config.cache could not answer them, which is quicker still.
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in daemon_commands or not os.path.exists(daemon_socket_path):
+        return
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(daemon_socket_path)
+    except OSError:
+        client.close()
+        return
+    with client:
+        send_frame(client, b'r', marshal.dumps({'argv': sys.argv[1:], 'cwd': os.getcwd()}))
+        try:
+            while True:
+                kind, data = receive_frame(client)
+                if kind == b'o':
+                    sys.stdout.buffer.write(data)
+                    sys.stdout.buffer.flush()
+                elif kind == b'e':
+                    sys.stderr.buffer.write(data)
+                    sys.stderr.buffer.flush()
+                elif kind == b'c':
+                    sys.exit(get_executor().interactive(marshal.loads(data), forward_stderr))
+                elif kind == b'x':
+                    sys.exit(int(data))
+        except EOFError:
+            print_styled("Error: the daemon closed the connection.", "red")
+            sys.exit(1)
+
+def daemon_request(connection, request, manager):
+    """
+    Runs one client request in this process with manager, which picks up
+    changes to config.json and state first, with its output sent back as
+    frames.
+    """
+    # ssh-exec hands its ssh command to the client, so ssh runs in the
+    # client's terminal
+    delegated = []
+    def delegate(cmd):
+        send_frame(connection, b'c', marshal.dumps(cmd))
+        delegated.append(cmd)
+        sys.exit(0)
+
+    command_context.delegate = delegate
+    try:
+        status = run_cli(request['argv'], FrameWriter(connection, b'o'), FrameWriter(connection, b'e'), request['cwd'], manager)
+    finally:
+        command_context.delegate = None
+    if not delegated:
+        try:
+            send_frame(connection, b'x', str(status).encode())
+        except OSError:
+            pass
+
+def valid_daemon_request(request):
+    """Whether request is a ping, a stop or a command line the daemon serves."""
+    if not isinstance(request, dict):
+        return False
+    if request.get('ping') or request.get('stop'):
+        return True
+    argv, cwd = request.get('argv'), request.get('cwd')
+    return (isinstance(argv, list) and len(argv) > 0 and all(isinstance(arg, str) for arg in argv)
+            and argv[0] in daemon_commands and isinstance(cwd, str))
+
+def serve_daemon():
+    """
+    Runs in the background, keeping the config and resolved servers loaded
+    and serving client requests one at a time. Mount state, tunnels and
+    master connections are read again for every request, since other mnt
+    processes change them.
+    """
+    if os.path.exists(daemon_socket_path):
+        os.remove(daemon_socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Created private, so no one else can ever connect
+    umask = os.umask(0o077)
+    try:
+        listener.bind(daemon_socket_path)
+    finally:
+        os.umask(umask)
+    listener.listen()
+    manager = Manager()
+    running = True
+
+    def handle(connection):
+        nonlocal running
+        with connection:
+            try:
+                request = marshal.loads(receive_frame(connection)[1])
+            except (EOFError, ValueError, TypeError):
+                return
+            if not valid_daemon_request(request):
+                try:
+                    send_frame(connection, b'e', b'Error: invalid request.\n')
+                    send_frame(connection, b'x', b'1')
+                except OSError:
+                    pass
+                return
+            if request.get('stop'):
+                running = False
+                listener.shutdown(socket.SHUT_RDWR)
+                return
+            if request.get('ping'):
+                send_frame(connection, b'x', b'0')
+                return
+            with daemon_lock:
+                daemon_request(connection, request, manager)
+
+    try:
+        while running:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=handle, args=(connection,), daemon=True).start()
+    finally:
+        listener.close()
+        if os.path.exists(daemon_socket_path):
+            os.remove(daemon_socket_path)
+    return 0
+
+def ping_daemon(request):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(daemon_socket_path)
+        send_frame(client, b'r', marshal.dumps(request))
+        if request.get('ping'):
+            receive_frame(client)
+        return True
+    except (OSError, EOFError):
+        return False
+    finally:
+        client.close()
+
+def daemon_command():
+    usage = 'Usage: mnt daemon <start|stop|status>'
+    action = command_args()[2] if len(command_args()) > 2 else None
+    if action == 'serve':
+        sys.exit(serve_daemon())
+    elif action == 'status':
+        if ping_daemon({'ping': True}):
+            print_styled(f"Daemon is running on {daemon_socket_path}.", "green")
+            sys.exit(0)
+        print_styled("Daemon is not running.", "italic")
+        sys.exit(1)
+    elif action == 'stop':
+        if not ping_daemon({'stop': True}):
+            print_styled("Daemon is not running.", "italic")
+            sys.exit(0)
+        print_styled("Stopped the daemon.", "green")
+        sys.exit(0)
+    elif action != 'start':
+        print_styled(usage, "red")
+        sys.exit(0)
+
+    if ping_daemon({'ping': True}):
+        print_styled("Daemon is already running.", "yellow")
+        sys.exit(0)
+    with open(daemon_log_path, 'w') as log:
+        process = get_executor().spawn(
+            [sys.executable, os.path.abspath(__file__), 'daemon', 'serve'],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True
+        )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if ping_daemon({'ping': True}):
+            print_styled("Started the daemon.", "green")
+            sys.exit(0)
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    print_styled(f"Could not start the daemon. See {daemon_log_path}", "red")
+    sys.exit(1)
+
+def fast_path():
+    """
+    Serves 'cd <name>' and 'ssh-exec <name> ...' from config.cache, without
+    loading config.json. Returns only if the cache can't answer.
+    """
+    if len(sys.argv) < 3 or sys.argv[1] not in ('cd', 'ssh-exec') or ',' in sys.argv[2]:
+        return
+    server = load_cached_server(sys.argv[2])
+    if server is None:
+        return
+    if sys.argv[1] == 'cd':
+        if server.get('mount_path') is None:
+            return
+        print(server.get('mount_path'))
+        sys.exit(0)
+    run_ssh_exec(server, " ".join(sys.argv[3:]))
+
+def main():
+    fast_path()
+    daemon_client()
+    try:
+        manager = Manager()
+    except ConfigError as e:
+        print(e)
+        sys.exit(0)
+    output_context.live = True
     try:
-        command = sys.argv[1]
+        dispatch(manager)
+    except MntError as e:
+        print_styled(str(e), "red")
+        sys.exit(1)
+
+def dispatch(manager):
+    """Runs the command in command_args() through manager."""
+    try:
+        command = command_args()[1]
     except IndexError:
         print_styled('mnt.py', ["bold","italic"])
         print_styled('No command given.', "red")
         sys.exit(0)
 
     if command == 'mount':
-        try:
-            server = sys.argv[2]
-        except IndexError:
-            print_styled('No server given. Usage: mnt mount <server_name>. E.g. \"mnt mount sshfs\"', "red")
-            sys.exit(0)
-        if server in config['servers']:
-            mount(config['servers'][sys.argv[2]])
-        elif server in config['aliases']:
-            mount(config['aliases'][sys.argv[2]])
-        else:
-            print_styled(f"Server \"{server}\" does not exist. Use command \"mnt add <server_name> <command>\" to add it.", "red")
-            sys.exit(0)
+        mount_command(manager)
     elif command == 'add':
         add_server()
     elif command == 'alias':
         add_alias()
     elif command == 'unmount':
-        unmount_server()
+        unmount_server(manager)
     elif command == 'update':
-        update_server()
+        update_server(manager)
     elif command == 'delete':
         delete_server()
     elif command == 'list':
@@ -988,22 +3858,50 @@ if __name__ == '__main__':
     elif command == 'enable-cd':
         enable_cd()
     elif command == 'ssh-exec':
-        ssh_exec()
+        ssh_exec(manager)
     elif command == 'ssh':
         ssh_shell()
     elif command == 'refresh':
         refresh_server()
+    elif command == 'recent':
+        recent_servers()
+    elif command == 'status':
+        mount_status(manager)
+    elif command == 'health':
+        mount_health()
+    elif command == 'watch':
+        watch_servers()
     elif command == 'tunnel':
         add_tunnel()
+    elif command == 'group':
+        group_servers()
+    elif command == 'profile':
+        profile_command()
+    elif command == 'bench':
+        bench_command()
+    elif command == 'push' or command == 'pull':
+        transfer_command(command)
+    elif command == 'sync':
+        sync_command()
+    elif command == 'warm':
+        warm_command()
+    elif command == 'masters':
+        ssh_masters()
+    elif command == 'session':
+        session()
+    elif command == 'daemon':
+        daemon_command()
     elif command == 'help' or command == '-h':
         help()
     else:
-        if command in config['servers']:
-            mount(config['servers'][command])
-            sys.exit(0)
-        elif command in config['aliases']:
-            mount(config['aliases'][command])
-            sys.exit(0)
+        if command in config['servers'] or command in config['aliases']:
+            sys.exit(manager.mount(command).code)
+        elif command in config['groups']:
+            check_server_names(expand_groups([command]))
+            results = manager.mount_many([command])
+            sys.exit(1 if any(not result.ok for result in results) else 0)
         print_styled('Unknown command: ' + command, "red")
-        sys.exit(0)
+        sys.exit(1)
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+import pytest
+
+# mnt finds its config through HOME when it is imported, so point HOME at a
+# scratch directory first
+home = tempfile.mkdtemp(prefix='mnt-tests-')
+os.environ['HOME'] = home
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mnt
+
+
+def server_entry(name, **values):
+    entry = {
+        'name': name,
+        'command': f"sshfs u@{name}:/srv {home}/mnt/{name}",
+        'unmount_command': 'fusermount -u',
+        'mount_path': f"{home}/mnt/{name}",
+        'host': f"u@{name}",
+        'remote_dir': '/srv',
+    }
+    entry.update(values)
+    return entry
+
+
+@pytest.fixture
+def write_config():
+    """Replaces config.json, and the state and history next to it, with a fresh config."""
+    def write(servers = (), aliases = None, groups = None):
+        shutil.rmtree(mnt.config_folder, ignore_errors=True)
+        os.makedirs(mnt.config_folder)
+        config = {
+            'servers': {server['name']: server for server in servers},
+            'aliases': aliases or {},
+            'groups': groups or {},
+        }
+        with open(mnt.config_path, 'w') as f:
+            json.dump(config, f)
+        mnt.reload_config()
+        return config
+    return write
+
+
+@pytest.fixture
+def servers(write_config):
+    """Servers a, b and c, in group g."""
+    return write_config([server_entry(name) for name in 'abc'], groups={'g': ['a', 'b', 'c']})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(home, ignore_errors=True)
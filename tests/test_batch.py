@@ -0,0 +1,88 @@
+import pytest
+
+import mnt
+from mnt import FakeExecutor, Script
+from conftest import server_entry
+
+
+def fake_hosts():
+    # a succeeds, b fails with exit code 3 and c hangs until it is killed
+    return FakeExecutor({
+        'ssh *u@b*': Script(code=3, stderr=b'no such file\n'),
+        'ssh *u@c*': Script(hang=True),
+        'ssh *': Script(latency=0.01, lines=2),
+    })
+
+
+def test_exec_many_reports_exit_codes_and_timeouts(servers):
+    fake = fake_hosts()
+    manager = mnt.Manager(fake)
+
+    results = manager.ssh_exec_many(['g'], 'ls', timeout=0.2)
+
+    assert {result.name: result.code for result in results} == {'a': 0, 'b': 3, 'c': 124}
+    assert [result.ok for result in sorted(results, key=lambda result: result.name)] == [True, False, False]
+    assert 'no such file' in next(result.output for result in results if result.name == 'b')
+    assert 'Timed out after 0.2 seconds.' in next(result.output for result in results if result.name == 'c')
+    assert fake.running == 0
+
+
+def test_batch_summary_counts_exit_codes(servers):
+    manager = mnt.Manager(fake_hosts())
+
+    result = manager.run('ssh-exec', '--group', 'g', '--timeout', '0.2', '--', 'ls')
+
+    assert result.code == 1
+    assert '--- a ---' in result.output
+    assert '1 succeeded, 2 failed' in result.output
+    assert 'exit 3: 1, exit 124: 1' in result.output
+
+
+def test_unknown_name_in_comma_list_runs_nothing(servers):
+    # Without the comma check, the line would run on the last mounted server
+    mnt.record_mount('a', 0)
+    fake = fake_hosts()
+
+    result = mnt.Manager(fake).run('ssh-exec', 'a,typo', '--', 'uptime')
+
+    assert result.code == 1
+    assert 'Server "typo" does not exist.' in result.output
+    assert fake.calls == []
+
+
+def test_batch_runs_at_most_jobs_at_once(write_config):
+    names = [f"web-{i}" for i in range(12)]
+    write_config([server_entry(name) for name in names], groups={'web': names})
+    fake = FakeExecutor({'ssh *': Script(latency=0.05)})
+
+    results = mnt.Manager(fake).ssh_exec_many(['web'], 'uptime', jobs=4)
+
+    assert sorted(result.name for result in results) == sorted(names)
+    assert all(result.ok for result in results)
+    assert fake.max_running == 4
+    assert len(fake.calls) == 12
+
+
+def test_probe_of_hung_mount_releases_its_slot(monkeypatch, tmp_path):
+    fake = FakeExecutor({'*os.stat*': Script(hang=True)})
+    monkeypatch.setattr(mnt, 'executor', fake)
+
+    assert mnt.probe_mount(str(tmp_path), timeout=0.05) == ('hung', 0.05)
+    assert fake.running == 0
+
+
+def test_probe_of_failing_mount_is_broken(monkeypatch, tmp_path):
+    monkeypatch.setattr(mnt, 'executor', FakeExecutor({'*os.stat*': Script(code=1)}))
+
+    health, _ = mnt.probe_mount(str(tmp_path), timeout=1)
+
+    assert health == 'broken'
+
+
+def test_missing_program_raises_file_not_found():
+    fake = FakeExecutor({'*': Script(missing=True)})
+
+    with pytest.raises(FileNotFoundError):
+        fake.run(['sshfs', 'u@a:/srv', '/tmp/a'])
+    assert fake.running == 0
+
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import threading
+import subprocess
+
+import mnt
+from conftest import home, server_entry
+
+
+def read_config():
+    with open(mnt.config_path) as f:
+        return json.load(f)
+
+
+def test_concurrent_processes_keep_each_others_writes(servers):
+    env = dict(os.environ, HOME=home)
+    processes = [
+        subprocess.Popen([sys.executable, mnt.__file__, 'profile', f"p{i}", '-o', f"opt{i}"],
+                         env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for i in range(8)
+    ]
+    assert [process.wait() for process in processes] == [0] * 8
+
+    profiles = read_config()['profiles']
+    assert {name: profiles[name] for name in profiles} == {f"p{i}": ['-o', f"opt{i}"] for i in range(8)}
+    assert set(read_config()['servers']) == {'a', 'b', 'c'}
+
+
+def test_concurrent_threads_keep_each_others_writes(servers):
+    def add(i):
+        def change(current):
+            current['groups'][f"g{i}"] = ['a']
+        mnt.save_config(change)
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert set(read_config()['groups']) == {'g'} | {f"g{i}" for i in range(16)}
+    assert set(mnt.config['groups']) == set(read_config()['groups'])
+
+
+def test_write_keeps_changes_made_after_loading(servers):
+    # Another process adds a server after this one loaded the config
+    current = read_config()
+    current['servers']['d'] = server_entry('d')
+    with open(mnt.config_path, 'w') as f:
+        json.dump(current, f)
+
+    def change(current):
+        current['groups']['h'] = ['a']
+    mnt.save_config(change)
+
+    assert set(read_config()['servers']) == {'a', 'b', 'c', 'd'}
+    assert read_config()['groups']['h'] == ['a']
+    assert 'd' in mnt.config['servers']
+
+
+def test_history_keeps_concurrent_mounts(servers):
+    env = dict(os.environ, HOME=home)
+    code = f"import sys; sys.path.insert(0, {os.path.dirname(mnt.__file__)!r}); import mnt; mnt.reload_config(); mnt.record_mount(sys.argv[1], 0)"
+    processes = [subprocess.Popen([sys.executable, '-c', code, f"n{i}"], env=env) for i in range(8)]
+    assert [process.wait() for process in processes] == [0] * 8
+
+    with open(mnt.history_path) as f:
+        names = [entry['name'] for entry in json.load(f)['recent']]
+    assert sorted(names) == [f"n{i}" for i in range(8)]
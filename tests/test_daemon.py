@@ -0,0 +1,98 @@
+import time
+import socket
+import marshal
+import threading
+
+import pytest
+
+import mnt
+
+
+def test_frames_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        mnt.send_frame(left, b'o', b'hello\n')
+        mnt.send_frame(left, b'x', b'')
+        mnt.send_frame(left, b'e', b'\x00\xff')
+
+        assert mnt.receive_frame(right) == (b'o', b'hello\n')
+        assert mnt.receive_frame(right) == (b'x', b'')
+        assert mnt.receive_frame(right) == (b'e', b'\x00\xff')
+
+
+def test_frame_larger_than_the_socket_buffer():
+    data = bytes(range(256)) * 16384
+    left, right = socket.socketpair()
+    with left, right:
+        sender = threading.Thread(target=mnt.send_frame, args=(left, b'o', data))
+        sender.start()
+        received = mnt.receive_frame(right)
+        sender.join()
+
+    assert received == (b'o', data)
+
+
+def test_connection_closed_mid_frame():
+    left, right = socket.socketpair()
+    with right:
+        with left:
+            # The header announces ten bytes, but only three arrive
+            left.sendall(b'o\x00\x00\x00\x0aabc')
+        with pytest.raises(EOFError):
+            mnt.receive_frame(right)
+
+
+def test_frame_writer_sends_output_frames():
+    left, right = socket.socketpair()
+    with left, right:
+        writer = mnt.FrameWriter(left, b'o')
+        writer.write('text')
+        writer.buffer.write(b'bytes')
+
+        assert mnt.receive_frame(right) == (b'o', b'text')
+        assert mnt.receive_frame(right) == (b'o', b'bytes')
+
+
+@pytest.fixture
+def daemon(servers):
+    thread = threading.Thread(target=mnt.serve_daemon, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if mnt.ping_daemon({'ping': True}):
+            break
+        time.sleep(0.02)
+    yield
+    mnt.ping_daemon({'stop': True})
+    thread.join(5)
+
+
+def request(payload):
+    """Sends payload as a request and returns the frames of the answer."""
+    frames = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(mnt.daemon_socket_path)
+        mnt.send_frame(client, b'r', marshal.dumps(payload))
+        while not frames or frames[-1][0] != b'x':
+            frames.append(mnt.receive_frame(client))
+    return frames
+
+
+@pytest.mark.parametrize('payload', [
+    [1, 2],
+    'status',
+    {'argv': 'status', 'cwd': '/'},
+    {'argv': ['status', 3], 'cwd': '/'},
+    {'argv': ['status']},
+    {'argv': [], 'cwd': '/'},
+    {'argv': ['delete', 'a'], 'cwd': '/'},
+])
+def test_daemon_rejects_invalid_requests(daemon, payload):
+    assert request(payload) == [(b'e', b'Error: invalid request.\n'), (b'x', b'1')]
+    assert mnt.ping_daemon({'ping': True})
+
+
+def test_daemon_runs_a_command(daemon):
+    frames = request({'argv': ['status'], 'cwd': '/'})
+
+    assert frames[-1] == (b'x', b'0')
+    assert b'unmounted' in b''.join(data for kind, data in frames if kind == b'o')
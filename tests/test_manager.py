@@ -0,0 +1,155 @@
+import io
+import os
+import sys
+import threading
+
+import pytest
+
+import mnt
+from mnt import FakeExecutor, Script
+from conftest import server_entry
+
+
+def test_unknown_server(servers):
+    manager = mnt.Manager(FakeExecutor())
+
+    with pytest.raises(mnt.ServerNotFound):
+        manager.server('nope')
+    with pytest.raises(mnt.ServerNotFound):
+        manager.ssh_exec('nope', 'ls')
+    with pytest.raises(mnt.ServerNotFound):
+        manager.ssh_exec_many(['a', 'nope'], 'ls')
+
+
+def test_ssh_exec_without_host(write_config):
+    write_config([server_entry('local', host=None)])
+
+    with pytest.raises(mnt.InvalidValue):
+        mnt.Manager(FakeExecutor()).ssh_exec('local', 'ls')
+
+
+def test_invalid_update(servers):
+    manager = mnt.Manager(FakeExecutor())
+
+    with pytest.raises(mnt.InvalidValue):
+        manager.update('a', 'color', 'red')
+    with pytest.raises(mnt.InvalidValue):
+        manager.update('a', 'mode', 'copy')
+
+
+def test_invalid_config(servers):
+    with open(mnt.config_path, 'w') as f:
+        f.write('{')
+
+    with pytest.raises(mnt.ConfigError):
+        mnt.Manager()
+
+
+def test_errors_are_mnt_errors():
+    for error in (mnt.ConfigError, mnt.ServerNotFound, mnt.InvalidValue, mnt.CommandFailed, mnt.CommandTimeout):
+        assert issubclass(error, mnt.MntError)
+
+
+def test_check_raises_with_the_result(servers):
+    manager = mnt.Manager(FakeExecutor({'ssh *u@b*': Script(code=2, output=b'oops\n'), 'ssh *u@c*': Script(hang=True)}))
+
+    assert manager.ssh_exec('a', 'ls', check=True).ok
+
+    with pytest.raises(mnt.CommandFailed) as failed:
+        manager.ssh_exec('b', 'ls', check=True)
+    assert failed.value.result.code == 2
+    assert 'oops' in failed.value.result.output
+
+    with pytest.raises(mnt.CommandTimeout) as timed_out:
+        manager.ssh_exec('c', 'ls', timeout=0.1, check=True)
+    assert timed_out.value.result.code == 124
+
+
+def test_output_is_captured_without_colors(servers):
+    result = mnt.Manager(FakeExecutor()).run('status')
+
+    assert result.ok
+    assert '\033[' not in result.output
+    assert 'unmounted' in result.output
+
+
+def test_run_leaves_process_state_alone(servers, tmp_path):
+    (tmp_path / 'file').write_text('data')
+    manager = mnt.Manager(FakeExecutor())
+    argv, stdout, cwd = sys.argv, sys.stdout, os.getcwd()
+
+    result = manager.run('push', 'a', 'file', cwd=str(tmp_path))
+
+    assert (sys.argv, sys.stdout, os.getcwd()) == (argv, stdout, cwd)
+    assert 'is not a file' not in result.output
+
+
+def test_executor_stays_with_its_manager(servers):
+    fake = FakeExecutor()
+    default = mnt.executor
+
+    mnt.Manager(fake).ssh_exec('a', 'ls')
+
+    assert mnt.executor is default
+    assert len(fake.calls) == 1
+
+
+def test_operations_on_several_threads(servers):
+    fake = FakeExecutor({'ssh *': Script(latency=0.05, lines=3)})
+    manager = mnt.Manager(fake)
+    results = {}
+
+    def run(name):
+        results[name] = manager.ssh_exec(name, 'uptime')
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in 'abc']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(result.ok for result in results.values())
+    assert all(result.output.count('\n') == 3 for result in results.values())
+    assert fake.max_running == 3
+
+
+def test_run_cli_writes_to_the_given_streams(servers, capsys):
+    stdout, stderr = io.StringIO(), io.StringIO()
+
+    assert mnt.run_cli(['status'], stdout, stderr) == 0
+    assert mnt.run_cli(['status', 'nope'], stdout, stderr) == 1
+
+    assert 'unmounted' in stdout.getvalue()
+    assert 'does not exist' in stdout.getvalue()
+    assert capsys.readouterr() == ('', '')
+
+
+def test_unknown_command_fails(servers):
+    result = mnt.Manager(FakeExecutor()).run('groups')
+
+    assert result.code == 1
+    assert 'Unknown command: groups' in result.output
+
+
+def test_command_line_runs_through_the_manager(servers):
+    fake = FakeExecutor()
+
+    result = mnt.Manager(fake).run('ssh-exec', 'a,b', '--', 'uptime')
+
+    assert result.ok
+    assert len(fake.calls) == 2
+    assert '2 succeeded, 0 failed' in result.output
+
+
+def test_reload_swaps_the_config_under_the_lock(servers, write_config):
+    manager = mnt.Manager(FakeExecutor())
+    write_config([server_entry('d')])
+
+    with mnt.config_lock:
+        reloading = threading.Thread(target=manager.reload)
+        reloading.start()
+        reloading.join(0.1)
+        assert reloading.is_alive()
+    reloading.join()
+
+    assert list(manager.servers()) == ['d']
@@ -0,0 +1,39 @@
+import mnt
+
+
+rsync_output = """
+Number of files: 1,204 (reg: 1,100, dir: 104)
+Number of created files: 3 (reg: 3)
+Number of deleted files: 0
+Number of regular files transferred: 12
+Total file size: 48,213,904 bytes
+Total transferred file size: 1,048,576 bytes
+Literal data: 524,288 bytes
+Matched data: 524,288 bytes
+File list size: 0
+Total bytes sent: 530,112
+Total bytes received: 2,311
+
+sent 530,112 bytes  received 2,311 bytes  1,064,846.00 bytes/sec
+total size is 48,213,904  speedup is 90.55
+"""
+
+
+def test_parse_rsync_stats():
+    assert mnt.parse_rsync_stats(rsync_output) == {
+        'files': 12,
+        'total': 48213904,
+        'changed': 1048576,
+        'matched': 524288,
+        'sent': 530112,
+        'received': 2311,
+    }
+
+
+def test_parse_rsync_stats_of_older_rsync():
+    # rsync before 3.1 says "files transferred", without "regular"
+    assert mnt.parse_rsync_stats("Number of files transferred: 7\n")['files'] == 7
+
+
+def test_parse_rsync_stats_missing_numbers_are_zero():
+    assert set(mnt.parse_rsync_stats('rsync error: some files could not be transferred').values()) == {0}
@@ -0,0 +1,46 @@
+import mnt
+from conftest import home, server_entry
+
+
+def test_mount_path_lookup_picks_the_longest_prefix(write_config):
+    write_config([
+        server_entry('web', mount_path=f"{home}/mnt/web"),
+        server_entry('logs', mount_path=f"{home}/mnt/web/logs"),
+        server_entry('db', mount_path=f"{home}/mnt/db/"),
+    ])
+
+    assert mnt.get_server_from_mount_path(f"{home}/mnt/web") == ('web', None)
+    assert mnt.get_server_from_mount_path(f"{home}/mnt/web/src/app") == ('web', 'src/app')
+    assert mnt.get_server_from_mount_path(f"{home}/mnt/web/logs") == ('logs', None)
+    assert mnt.get_server_from_mount_path(f"{home}/mnt/web/logs/2024/01") == ('logs', '2024/01')
+    assert mnt.get_server_from_mount_path(f"{home}/mnt/db/tables") == ('db', 'tables')
+
+
+def test_mount_path_lookup_matches_whole_path_components(write_config):
+    write_config([server_entry('web', mount_path=f"{home}/mnt/web")])
+
+    assert mnt.get_server_from_mount_path(f"{home}/mnt/website") == (None, None)
+    assert mnt.get_server_from_mount_path(f"{home}/mnt") == (None, None)
+    assert mnt.get_server_from_mount_path('/') == (None, None)
+
+
+def test_mount_path_lookup_expands_home(write_config):
+    write_config([server_entry('web', mount_path='~/mnt/web')])
+
+    assert mnt.get_server_from_mount_path(f"{home}/mnt/web/src") == ('web', 'src')
+
+
+def test_mount_path_lookup_resolves_symlinks(write_config, tmp_path):
+    (tmp_path / 'mnt/web/src/app').mkdir(parents=True)
+    (tmp_path / 'volumes/db').mkdir(parents=True)
+    (tmp_path / 'project').symlink_to(tmp_path / 'mnt/web/src')
+    (tmp_path / 'db').symlink_to(tmp_path / 'volumes/db')
+    write_config([
+        server_entry('web', mount_path=str(tmp_path / 'mnt/web')),
+        server_entry('db', mount_path=str(tmp_path / 'db')),
+    ])
+
+    # cwd reached through a symlink into a mount
+    assert mnt.get_server_from_mount_path(str(tmp_path / 'project/app')) == ('web', 'src/app')
+    # Mount path that is itself a symlink
+    assert mnt.get_server_from_mount_path(str(tmp_path / 'volumes/db')) == ('db', None)
@@ -0,0 +1,72 @@
+import mnt
+
+
+mountinfo = (
+    "22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n"
+    "36 22 0:31 / /proc rw,nosuid,nodev,noexec,relatime shared:5 - proc proc rw\n"
+    # No optional fields before the separator
+    "48 22 0:45 / /home/u/mnt/web rw,nosuid,nodev,relatime - fuse.sshfs u@web:/var/www rw,user_id=1000\n"
+    # Several optional fields, and a space escaped in both the mount point and the source
+    "49 22 0:46 / /home/u/mnt/my\\040site rw,relatime shared:7 master:2 - fuse.sshfs u@web:/srv/my\\040site rw\n"
+)
+
+tcp = (
+    "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+    "   0: 0100007F:1F90 00000000:0000 0A 00000000:00000000 00:00000000 00000000  1000        0 1 1 0 100 0 0 10 0\n"
+    # Established, not listening
+    "   1: 0100007F:D431 0100007F:1F90 01 00000000:00000000 00:00000000 00000000  1000        0 2 1 0 20 4 30 10 -1\n"
+)
+
+tcp6 = (
+    "  sl  local_address                         remote_address                        st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+    "   0: 00000000000000000000000000000000:0016 00000000000000000000000000000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 3 1 0 100 0 0 10 0\n"
+)
+
+
+def test_read_mountinfo(tmp_path):
+    path = tmp_path / 'mountinfo'
+    path.write_text(mountinfo)
+
+    mounts = mnt.read_mountinfo(str(path))
+
+    assert mounts['/'] == ('ext4', '/dev/sda1')
+    assert mounts['/home/u/mnt/web'] == ('fuse.sshfs', 'u@web:/var/www')
+    assert mounts['/home/u/mnt/my site'] == ('fuse.sshfs', 'u@web:/srv/my site')
+    assert len(mounts) == 4
+
+
+def test_read_mountinfo_skips_malformed_lines(tmp_path):
+    path = tmp_path / 'mountinfo'
+    path.write_text(
+        "22 1 8:1 / / rw,relatime shared:1 ext4 /dev/sda1 rw\n"
+        "23 22 0:5 / /dev\n"
+        "\n"
+        "48 22 0:45 / /home/u/mnt/web rw,relatime - fuse.sshfs u@web:/var/www rw\n"
+        "49 22 0:46 / /home/u/mnt/db rw,relatime -\n"
+    )
+
+    assert mnt.read_mountinfo(str(path)) == {'/home/u/mnt/web': ('fuse.sshfs', 'u@web:/var/www')}
+
+
+def test_read_mountinfo_missing_file(tmp_path):
+    assert mnt.read_mountinfo(str(tmp_path / 'missing')) == {}
+
+
+def test_read_listening_ports(tmp_path):
+    (tmp_path / 'tcp').write_text(tcp)
+    (tmp_path / 'tcp6').write_text(tcp6)
+
+    assert mnt.read_listening_ports([str(tmp_path / 'tcp'), str(tmp_path / 'tcp6')]) == {8080, 22}
+
+
+def test_read_listening_ports_skips_malformed_lines(tmp_path):
+    header, listening, _ = tcp.splitlines(True)
+    (tmp_path / 'tcp').write_text(header + "   2: 0100007F\n" + "   3: 0100007F:ZZZZ 00000000:0000 0A\n" + listening)
+
+    assert mnt.read_listening_ports([str(tmp_path / 'tcp')]) == {8080}
+
+
+def test_read_listening_ports_skips_missing_and_empty_files(tmp_path):
+    (tmp_path / 'tcp').write_text('')
+
+    assert mnt.read_listening_ports([str(tmp_path / 'tcp'), str(tmp_path / 'missing')]) == set()
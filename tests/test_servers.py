@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import mnt
+from conftest import server_entry
+
+
+def read_config():
+    with open(mnt.config_path) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def aliased(write_config):
+    return write_config(
+        [server_entry('web', port=2222)],
+        aliases={'web-logs': {'name': 'web-logs', 'server_name': 'web', 'remote_dir': '/var/log', 'mount_path': '/tmp/web-logs'}},
+    )
+
+
+def test_alias_lays_its_properties_over_its_server(aliased):
+    alias = mnt.find_server('web-logs')
+
+    assert alias.is_alias and alias.parent_name == 'web'
+    assert (alias.host, alias.port, alias.remote_dir) == ('u@web', 2222, '/var/log')
+    assert sorted(alias.aliased_properties) == ['mount_path', 'name', 'remote_dir']
+
+
+def test_servers_are_resolved_once_per_config_load(aliased):
+    assert mnt.find_server('web') is mnt.find_server('web')
+
+    mnt.reload_config()
+
+    assert mnt.resolve_servers() is mnt.resolve_servers()
+
+
+def test_server_records_have_no_instance_dict(aliased):
+    with pytest.raises(AttributeError):
+        mnt.find_server('web').not_a_property = 1
+
+
+def test_set_writes_only_the_changed_property(aliased):
+    server = mnt.find_server('web')
+    # Another process changes a different property after this one loaded it
+    current = read_config()
+    current['servers']['web']['key_path'] = '~/.ssh/web'
+    with open(mnt.config_path, 'w') as f:
+        json.dump(current, f)
+
+    server.set('remote_dir', '/srv/app')
+
+    entry = read_config()['servers']['web']
+    assert entry['remote_dir'] == '/srv/app'
+    assert entry['key_path'] == '~/.ssh/web'
+    assert server.changed == set()
+
+
+def test_alias_set_does_not_copy_inherited_properties(aliased):
+    mnt.find_server('web-logs').set('pre_command', 'cd logs')
+
+    entry = read_config()['aliases']['web-logs']
+    assert entry['pre_command'] == 'cd logs'
+    assert 'host' not in entry and 'port' not in entry
+    assert 'pre_command' not in read_config()['servers']['web']
+
+
+def test_unsaved_changes_are_written_together(aliased):
+    server = mnt.find_server('web')
+    server.set('remote_dir', '/srv/a', save=False)
+    server.set('shell', 'zsh', save=False)
+
+    assert 'shell' not in read_config()['servers']['web']
+
+    server.save_server()
+
+    entry = read_config()['servers']['web']
+    assert (entry['remote_dir'], entry['shell']) == ('/srv/a', 'zsh')
@@ -0,0 +1,113 @@
+import re
+
+import pytest
+
+import mnt
+from mnt import FakeExecutor, Script
+
+
+data = b'0123456789'
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # 10 bytes make three ranges: 0-3, 4-7 and 8-9
+    monkeypatch.setattr(mnt, 'transfer_chunk_size', 4)
+
+
+def remote_file(short = ()):
+    """Serves data for pulls, with ranges at the offsets in short cut off."""
+    scripts = {"*wc -c <*": Script(output=b'%d\n' % len(data))}
+    for offset in range(0, len(data), 4):
+        chunk = data[offset:offset + 4]
+        scripts[f"*skip={offset} count={len(chunk)} *"] = Script(output=chunk[:1] if offset in short else chunk)
+    return FakeExecutor(scripts)
+
+
+def ranges(fake, pattern):
+    return sorted(tuple(int(value) for value in match) for call in fake.calls for match in re.findall(pattern, call))
+
+
+def transfer(fake, direction, local, resume = False):
+    server = mnt.find_server('a')
+    return mnt.capture('transfer', lambda: mnt.transfer(server, direction, str(local), '/srv/file', 2, False, resume), executor = fake)
+
+
+def test_pull_copies_every_range(servers, tmp_path):
+    fake = remote_file()
+
+    result = transfer(fake, 'pull', tmp_path / 'file')
+
+    assert result.ok
+    assert (tmp_path / 'file').read_bytes() == data
+    assert ranges(fake, r'skip=(\d+) count=(\d+)') == [(0, 4), (4, 4), (8, 2)]
+
+
+def test_push_sizes_the_target_and_writes_every_range(servers, tmp_path):
+    (tmp_path / 'file').write_bytes(data)
+    fake = FakeExecutor()
+
+    result = transfer(fake, 'push', tmp_path / 'file')
+
+    assert result.ok
+    assert any('truncate -s 10 ' in call for call in fake.calls)
+    assert ranges(fake, r'seek=(\d+)') == [(0,), (4,), (8,)]
+
+
+def test_resume_copies_only_what_failed(servers, tmp_path):
+    local = tmp_path / 'file'
+
+    failed = transfer(remote_file(short = {4}), 'pull', local)
+
+    assert failed.code == 1
+    assert 'got 1 of 4 bytes' in failed.output
+    assert '--resume' in failed.output
+
+    fake = remote_file()
+    resumed = transfer(fake, 'pull', local, resume = True)
+
+    assert resumed.ok
+    assert 'Resuming: 2 of 3 chunk(s) already transferred.' in resumed.output
+    assert ranges(fake, r'skip=(\d+) count=(\d+)') == [(4, 4)]
+    assert local.read_bytes() == data
+
+
+def test_without_resume_everything_is_copied_again(servers, tmp_path):
+    local = tmp_path / 'file'
+    transfer(remote_file(short = {4}), 'pull', local)
+
+    fake = remote_file()
+    assert transfer(fake, 'pull', local).ok
+
+    assert len(ranges(fake, r'skip=(\d+) count=(\d+)')) == 3
+
+
+def test_resume_starts_over_when_the_ranges_changed(servers, tmp_path, monkeypatch):
+    local = tmp_path / 'file'
+    transfer(remote_file(short = {4}), 'pull', local)
+
+    # The same file, split into other ranges now
+    monkeypatch.setattr(mnt, 'transfer_chunk_size', 5)
+    fake = FakeExecutor({
+        "*wc -c <*": Script(output=b'10\n'),
+        "*skip=0 count=5 *": Script(output=data[:5]),
+        "*skip=5 count=5 *": Script(output=data[5:]),
+    })
+    resumed = transfer(fake, 'pull', local, resume = True)
+
+    assert resumed.ok
+    assert 'Resuming' not in resumed.output
+    assert ranges(fake, r'skip=(\d+) count=(\d+)') == [(0, 5), (5, 5)]
+    assert local.read_bytes() == data
+
+
+def test_finished_transfer_clears_its_record(servers, tmp_path):
+    local = tmp_path / 'file'
+    transfer(remote_file(short = {4}), 'pull', local)
+    transfer(remote_file(), 'pull', local, resume = True)
+
+    fake = remote_file()
+    result = transfer(fake, 'pull', local, resume = True)
+
+    assert 'Resuming' not in result.output
+    assert len(ranges(fake, r'skip=(\d+) count=(\d+)')) == 3
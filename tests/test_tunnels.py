@@ -0,0 +1,136 @@
+import os
+import json
+import socket
+
+import pytest
+
+import mnt
+from mnt import FakeExecutor, Script
+from conftest import server_entry
+
+
+class TunnelExecutor(FakeExecutor):
+    """Starts listening on the tunnel's port when ssh -f opens the tunnel."""
+
+    def __init__(self, listener, exit_code = 0):
+        super().__init__({
+            'ssh -O check *': Script(stderr=b'Master running (pid=4242)\r\n'),
+            'ssh -O exit *': Script(code=exit_code),
+            'ssh -f *': Script(),
+        })
+        self.listener = listener
+
+    def start(self, cmd):
+        process = super().start(cmd)
+        if process.args.startswith('ssh -f '):
+            self.listener.listen()
+        return process
+
+
+@pytest.fixture
+def listener():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    yield listener
+    listener.close()
+
+
+@pytest.fixture
+def tunneled(write_config, listener):
+    """Servers a and b behind one tunnel, and c behind another."""
+    port = listener.getsockname()[1]
+    tunnel = {'host': 'u@db', 'tunnel_host': 'jump', 'tunnel_port': 5432, 'port': port}
+    write_config([
+        server_entry('a', **tunnel),
+        server_entry('b', **tunnel),
+        server_entry('c', **dict(tunnel, tunnel_port=6379)),
+    ])
+    return mnt.find_server('a').tunnel_id()
+
+
+def run(fake, action):
+    return mnt.capture('tunnel', action, executor = fake)
+
+
+def refs(tunnel):
+    mnt.refresh_state()
+    return mnt.get_state(tunnel, 'refs')
+
+
+def opened(fake):
+    return [call for call in fake.calls if call.startswith('ssh -f ')]
+
+
+def closed(fake):
+    return [call for call in fake.calls if call.startswith('ssh -O exit ')]
+
+
+def test_shared_tunnel_opens_once_and_closes_with_its_last_user(tunneled, listener):
+    fake = TunnelExecutor(listener)
+
+    assert run(fake, lambda: mnt.find_server('a').setup_tunnel()).ok
+    assert run(fake, lambda: mnt.find_server('b').setup_tunnel()).ok
+    assert len(opened(fake)) == 1
+    assert refs(tunneled) == ['a', 'b']
+    assert mnt.get_state(tunneled, 'pid') == 4242
+
+    result = run(fake, lambda: mnt.find_server('a').destroy_tunnel())
+    assert 'still used by b' in result.output
+    assert closed(fake) == []
+    assert refs(tunneled) == ['b']
+
+    assert run(fake, lambda: mnt.find_server('b').destroy_tunnel()).ok
+    assert len(closed(fake)) == 1
+    assert mnt.get_state(tunneled, 'pid') is None
+    assert refs(tunneled) == []
+
+
+def test_claims_are_counted_once_per_server(tunneled, listener):
+    fake = TunnelExecutor(listener)
+    run(fake, lambda: mnt.find_server('a').setup_tunnel())
+
+    for _ in range(3):
+        mnt.find_server('b').claim_tunnel()
+
+    assert refs(tunneled) == ['a', 'b']
+
+
+def test_servers_behind_other_tunnels_are_tracked_apart(tunneled):
+    assert mnt.find_server('c').tunnel_id() != tunneled
+    assert mnt.find_server('a').tunnel_key() == mnt.find_server('b').tunnel_key()
+
+
+def test_reuse_sees_a_tunnel_closed_by_another_process(tunneled, listener):
+    fake = TunnelExecutor(listener)
+    run(fake, lambda: mnt.find_server('a').setup_tunnel())
+    # This process still has the tunnel's record cached, when another
+    # process drops it
+    assert mnt.get_state(tunneled, 'pid') == 4242
+    with open(mnt.state_path, 'a') as f:
+        f.write(json.dumps({'name': tunneled, 'pid': None, 'refs': []}) + '\n')
+
+    result = run(fake, lambda: mnt.find_server('b').setup_tunnel())
+
+    assert result.ok
+    assert 'not started by mnt' in result.output
+    assert refs(tunneled) == []
+
+
+def test_destroy_with_stale_pid_counts_as_closed(tunneled, listener):
+    fake = TunnelExecutor(listener, exit_code=255)
+    run(fake, lambda: mnt.find_server('a').setup_tunnel())
+    # Reused by a process that isn't the tunnel, here the tests themselves
+    mnt.set_state(tunneled, pid = os.getpid())
+
+    result = run(fake, lambda: mnt.find_server('a').destroy_tunnel())
+
+    assert result.ok
+    assert 'already closed' in result.output
+    assert mnt.get_state(tunneled, 'pid') is None
+
+
+def test_destroy_without_a_tunnel_opened_by_mnt(tunneled):
+    result = run(FakeExecutor(), lambda: mnt.find_server('a').destroy_tunnel())
+
+    assert result.ok
+    assert 'No tunnel opened by mnt' in result.output